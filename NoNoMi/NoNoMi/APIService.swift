@@ -27,6 +27,8 @@ class APIService: ObservableObject {
     private let agentApiURL = "https://adventurex-2025.vercel.app/agent"
     private let renderApiURL = "https://adventurex-2025.vercel.app/render"
     private let apiKey = "qaq"
+    // 后端按设备限流（所有设备共用同一个 API Key）
+    private let deviceId = UIDevice.current.identifierForVendor?.uuidString ?? UUID().uuidString
     
     @Published var responseText: String = ""
     @Published var isLoading: Bool = false
@@ -107,6 +109,7 @@ class APIService: ObservableObject {
         request.httpMethod = "POST"
         request.timeoutInterval = 30.0
         request.addValue(apiKey, forHTTPHeaderField: "X-API-KEY")
+        request.addValue(deviceId, forHTTPHeaderField: "X-Device-Id")
         request.addValue("application/json", forHTTPHeaderField: "Content-Type")
         
         let imageUrlString = "data:image/jpeg;base64,\(base64String)"
@@ -186,6 +189,7 @@ class APIService: ObservableObject {
         request.httpMethod = "POST"
         request.timeoutInterval = 45.0 // Longer timeout for widget generation
         request.addValue(apiKey, forHTTPHeaderField: "X-API-KEY")
+        request.addValue(deviceId, forHTTPHeaderField: "X-Device-Id")
         request.addValue("application/json", forHTTPHeaderField: "Content-Type")
         
         let imageUrlString = "data:image/jpeg;base64,\(base64String)"
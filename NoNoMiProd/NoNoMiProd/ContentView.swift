@@ -14,6 +14,8 @@ struct ContentView: View {
     @StateObject private var audioPlayer = AudioPlayer()
     @State private var showQRWebView = false
     @State private var qrURL = ""
+    // 已经弹出过WebView的二维码；摘要补充等针对同一二维码的状态更新不再重复弹出
+    @State private var presentedQR: String? = nil
     
     var body: some View {
         ZStack {
@@ -139,6 +141,10 @@ struct ContentView: View {
                 print("检测到新数据...")
                 print("新状态详情: timestamp=\(status.timestamp), voice=\(status.voice ?? ""), action=\(status.action ?? "")")
                 
+                if status.action != "qr" {
+                    presentedQR = nil
+                }
+                
                 // 检查是否为pending action
                 if status.action == "pending" {
                     print("检测到pending action，播放pending音频...")
@@ -164,10 +170,15 @@ struct ContentView: View {
                 }
                 // 检查是否为二维码action
                 else if status.action == "qr", let qrValue = status.value {
-                    print("检测到二维码action，显示WebView...")
-                    qrURL = qrValue
-                    withAnimation(.easeInOut(duration: 0.3)) {
-                        showQRWebView = true
+                    if qrValue != presentedQR {
+                        print("检测到二维码action，显示WebView...")
+                        presentedQR = qrValue
+                        qrURL = qrValue
+                        withAnimation(.easeInOut(duration: 0.3)) {
+                            showQRWebView = true
+                        }
+                    } else {
+                        print("同一二维码的状态更新（如摘要），只刷新弹幕")
                     }
                 }
                 // 其他action或无action时，也播放语音（兼容性处理）
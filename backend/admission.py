@@ -0,0 +1,242 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+# 每个设备的令牌桶：平均每秒请求数、突发容量
+KEY_RATE = float(os.environ.get("KEY_RATE", 2))
+KEY_BURST = float(os.environ.get("KEY_BURST", 10))
+# 每个模型的令牌桶（所有 Key 共享），对应上游账号的速率限制
+MODEL_RATE = float(os.environ.get("MODEL_RATE", 20))
+MODEL_BURST = float(os.environ.get("MODEL_BURST", 40))
+# 同时排队等待令牌的请求数上限
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 64))
+# 最长排队时间（秒）：预计等待超过该值的请求立即拒绝，而不是排到客户端超时
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", 5))
+# 最多保留的设备令牌桶数，超出时淘汰最久未使用的
+ADMISSION_MAX_KEYS = int(os.environ.get("ADMISSION_MAX_KEYS", 10000))
+# 保留最近多少次排队时间用于计算分位数
+WAIT_SAMPLES = 1024
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    采用预约方式：取令牌时余额可以变成负数，负数部分表示需要等待的时间，
+    这样在真正等待之前就能知道要等多久，超过期限的请求可以立即拒绝
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def is_full(self, now: float) -> bool:
+        """补充到 now 时桶是否已满（满的桶与新建的桶等价，可以丢弃）"""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost: float, now: float) -> float:
+        """
+        预约令牌
+
+        Args:
+            cost: 需要的令牌数
+            now: 当前时间（monotonic）
+
+        Returns:
+            float: 需要等待的秒数（0 表示立即可用）
+        """
+        self._refill(now)
+        self.tokens -= cost
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, cost: float):
+        """退还预约的令牌（请求被拒绝时）"""
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class AdmissionController:
+    """
+    准入控制
+
+    每个请求同时从调用方（设备）的令牌桶和模型的令牌桶中预约令牌：
+        - 两者都有余量时立即放行
+        - 需要等待时进入有界队列，等待时间超过 max_wait 或队列已满时立即返回 429 和 Retry-After
+    """
+
+    def __init__(self, key_rate: float = KEY_RATE, key_burst: float = KEY_BURST,
+                 model_rate: float = MODEL_RATE, model_burst: float = MODEL_BURST,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, max_wait: float = ADMISSION_MAX_WAIT,
+                 max_keys: int = ADMISSION_MAX_KEYS):
+        """
+        初始化准入控制
+
+        Args:
+            key_rate: 每个调用方每秒的请求数
+            key_burst: 每个调用方的突发容量
+            model_rate: 每个模型每秒的请求数
+            model_burst: 每个模型的突发容量
+            queue_size: 排队请求数上限
+            max_wait: 最长排队时间（秒）
+            max_keys: 最多保留的调用方令牌桶数
+        """
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.model_rate = model_rate
+        self.model_burst = model_burst
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.max_keys = max_keys
+        self._key_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._model_buckets: Dict[str, TokenBucket] = {}
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.wait_total = 0.0
+        self.keys_evicted = 0
+
+    def _key_bucket(self, key: str, now: float) -> TokenBucket:
+        """
+        获取调用方的令牌桶（按最近使用排序）
+
+        已经补满的空闲桶与新建的桶等价，直接丢弃；数量仍超过 max_keys 时淘汰最久未使用的，
+        伪造大量不同的调用方标识也不会让内存无限增长
+        """
+        buckets = self._key_buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+        buckets.move_to_end(key)
+        while len(buckets) > 1:
+            oldest_key, oldest = next(iter(buckets.items()))
+            if len(buckets) <= self.max_keys and not oldest.is_full(now):
+                break
+            del buckets[oldest_key]
+            self.keys_evicted += 1
+        return bucket
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], name: str, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(name)
+        if bucket is None:
+            bucket = buckets[name] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, key: str, model: str, cost: float = 1):
+        """
+        申请准入，必要时排队等待
+
+        Args:
+            key: 调用方标识（设备ID或客户端地址，见 app.admission_key）
+            model: 模型名称
+            cost: 消耗的令牌数（批量请求按条目数计算）
+
+        Raises:
+            AdmissionRejected: 预计等待超过期限或队列已满
+        """
+        now = time.monotonic()
+        key_bucket = self._key_bucket(key, now)
+        model_bucket = self._bucket(self._model_buckets, model, self.model_rate, self.model_burst)
+        # 单线程事件循环中，两次预约之间不会被其他请求打断
+        wait = max(key_bucket.reserve(cost, now), model_bucket.reserve(cost, now))
+        if wait > 0:
+            reason = None
+            if wait > self.max_wait:
+                reason = "rate_limited"
+            elif self.queue_depth >= self.queue_size:
+                reason = "queue_full"
+            if reason is not None:
+                key_bucket.refund(cost)
+                model_bucket.refund(cost)
+                self.rejected[reason] += 1
+                raise AdmissionRejected(reason, wait)
+            self.queued += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 排队期间客户端断开，退还预约的令牌
+                key_bucket.refund(cost)
+                model_bucket.refund(cost)
+                raise
+            finally:
+                self.queue_depth -= 1
+        self.admitted += 1
+        self._waits.append(wait)
+        self.wait_total += wait
+
+    def stats(self) -> dict:
+        """
+        获取准入统计
+
+        Returns:
+            dict: 放行/排队/拒绝次数、当前与最大队列深度、排队时间（平均、p50、p95、最大）
+        """
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_ms": {
+                "avg": self.wait_total / self.admitted * 1000 if self.admitted else 0.0,
+                "p50": percentile(0.5) * 1000,
+                "p95": percentile(0.95) * 1000,
+                "max": (waits[-1] if waits else 0.0) * 1000,
+            },
+            "keys": len(self._key_buckets),
+            "keys_evicted": self.keys_evicted,
+        }
+
+
+def retry_after_header(rejected: AdmissionRejected) -> str:
+    """Retry-After 只能是整数秒，向上取整且至少为1"""
+    return str(max(1, math.ceil(rejected.retry_after)))
+
+
+# 全局实例
+_admission_instance: Optional[AdmissionController] = None
+
+def get_admission_controller() -> AdmissionController:
+    """
+    获取全局准入控制实例
+
+    Returns:
+        AdmissionController: 准入控制实例
+    """
+    global _admission_instance
+    if _admission_instance is None:
+        _admission_instance = AdmissionController()
+    return _admission_instance
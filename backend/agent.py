@@ -1,24 +1,189 @@
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI
 import traceback
+import asyncio
 import os
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 # 添加LocalTracer导入
 import sys
 sys.path.append('../local')
 from local_tracer import LocalTracer
+from response_cache import get_response_cache, request_key
 
 # 初始化LocalTracer
 tracer = LocalTracer(storage_path="./logs")
 
-def gpt_4o_mini(messages, thread_id=None):
+MODEL = "gpt-4o-mini"
+# 同时进行的上游请求数上限，超出的请求在这里排队，避免一次性打满 OpenAI 的速率限制
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", 32))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 2))
+# 启动时预先建立的上游连接数（0 表示不预热）
+OPENAI_WARMUP_CONNECTIONS = int(os.environ.get("OPENAI_WARMUP_CONNECTIONS", 2))
+# 是否用 LocalTracer 记录每次对话
+BACKEND_TRACE = int(os.environ.get("BACKEND_TRACE", 1))
+# 是否合并相同的进行中请求
+SINGLE_FLIGHT = int(os.environ.get("SINGLE_FLIGHT", 1))
+
+# 全局共享的异步客户端（内部持有连接池）
+_client = None
+_upstream_limit = None
+
+
+def get_client() -> AsyncOpenAI:
+    """
+    获取全局共享的 AsyncOpenAI 客户端
+
+    所有请求复用同一个客户端及其 HTTP 连接池，不再每次请求都新建客户端、重新握手
+
+    Returns:
+        AsyncOpenAI: 客户端实例
+    """
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+
+@asynccontextmanager
+async def upstream_slot():
+    """占用一个上游并发名额"""
+    global _upstream_limit
+    if _upstream_limit is None:
+        _upstream_limit = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+    async with _upstream_limit:
+        yield
+
+
+async def warmup(connections: int = OPENAI_WARMUP_CONNECTIONS):
+    """
+    预热上游连接：并发发起几个轻量请求，让连接池里提前建立好 TLS 连接
+
+    Args:
+        connections: 预热的连接数
+    """
+    if connections <= 0:
+        return
+    client = get_client()
+    results = await asyncio.gather(*(client.models.list() for _ in range(connections)), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        print(f"上游连接预热失败 {len(failed)}/{connections}: {failed[0]}")
+    else:
+        print(f"上游连接预热完成: {connections} 个连接")
+
+
+async def close_client():
+    """关闭共享客户端，释放连接池"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+class SingleFlight:
+    """
+    合并相同的进行中请求（single-flight）
+
+    同一个键已有请求在进行时，后来的请求不再发起新的上游调用，而是等待并共享同一个结果。
+    上游调用在独立的任务中执行，某个等待者断开（被取消）不会影响其他等待者
+    """
+
+    def __init__(self, enabled: int = SINGLE_FLIGHT):
+        """
+        初始化
+
+        Args:
+            enabled: 为0时每个请求都独立调用上游（用于对比测试）
+        """
+        self.enabled = enabled
+        self._flights = {}  # key -> asyncio.Task
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory):
+        """
+        执行或加入一个请求
+
+        Args:
+            key: 请求键，相同的键共享结果
+            factory: 无参数的协程函数，真正发起上游调用
+
+        Returns:
+            tuple: (结果, 是否由本次调用发起)
+        """
+        if not self.enabled:
+            self.leaders += 1
+            return await factory(), True
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), False
+        task = asyncio.ensure_future(factory())
+        self._flights[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), True
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._flights.pop(key, None)
+        # 所有等待者都已断开时没有人读取异常，这里读取一次避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        """
+        获取合并统计
+
+        Returns:
+            dict: leaders（实际发起的上游调用）、coalesced（被合并的请求）、in_flight
+        """
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
+
+
+single_flight = SingleFlight()
+
+
+def new_thread_id() -> str:
+    """生成一个基于时间的唯一ID"""
+    return f"thread_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def estimate_cost(usage) -> float:
+    """
+    按 gpt-4o-mini 的价格估算费用
+
+    Args:
+        usage: 响应中的 usage
+
+    Returns:
+        float: 估算费用（美元）
+    """
+    # 参考 https://openai.com/api/pricing/
+    # gpt-4o-mini
+    # $0.150 / 1M input tokens
+    # $0.600 / 1M output tokens
+    return (usage.prompt_tokens / 1000000) * 0.150 + (usage.completion_tokens / 1000000) * 0.600
+
+
+async def trace(thread_id: str, messages: list, content: str):
+    """在线程中写对话日志，不阻塞事件循环"""
+    if BACKEND_TRACE:
+        await asyncio.to_thread(tracer.log_conversation, thread_id, messages, {"content": content})
+
+
+async def gpt_4o_mini(messages, thread_id=None):
     # 如果没有提供thread_id，生成一个基于时间的唯一ID
     if thread_id is None:
-        thread_id = f"thread_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-    
-    # 参考 https://openai.com/api/pricing/
+        thread_id = new_thread_id()
+
     """
     messages=[
         {
@@ -30,24 +195,44 @@ def gpt_4o_mini(messages, thread_id=None):
         }
     ]
     """
-    client = OpenAI()
+    cache = get_response_cache()
+
+    async def complete():
+        async with upstream_slot():
+            response = await get_client().chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                # max_tokens=10
+            )
+        reply = response.choices[0].message.content.strip()
+        if cache is not None:
+            await cache.aput(key, reply)
+        await trace(thread_id, messages, reply)
+        return reply, estimate_cost(response.usage)
+
     try:
-        # 使用LocalTracer作为回调
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            # 添加回调处理器
-            extra_headers={
-                "langchain_callback_handlers": [tracer],
-                "langchain_metadata": {"thread_id": thread_id}
+        key, request_bytes = request_key("agent", MODEL, messages)
+        if cache is not None:
+            reply = await cache.aget(key, request_bytes)
+            if reply is not None:
+                # 命中缓存时没有产生上游费用
+                return {
+                    "status": 0,
+                    "result": reply,
+                    "estimated_cost": 0,
+                    "thread_id": thread_id,
+                    "cached": True
+                }
+        (reply, estimated_cost), leader = await single_flight.do(key, complete)
+        if not leader:
+            # 与进行中的相同请求共享结果，费用只计在发起的请求上
+            return {
+                "status": 0,
+                "result": reply,
+                "estimated_cost": 0,
+                "thread_id": thread_id,
+                "coalesced": True
             }
-            # max_tokens=10
-        )
-        # gpt-4o-mini
-        # $0.150 / 1M input tokens
-        # $0.600 / 1M output tokens
-        reply = response.choices[0].message.content.strip()
-        estimated_cost = (response.usage.prompt_tokens / 1000000) * 0.150 + (response.usage.completion_tokens / 1000000) * 0.600
         return {
             "status": 0,
             "result": reply,
@@ -63,7 +248,70 @@ def gpt_4o_mini(messages, thread_id=None):
             "thread_id": thread_id
         }
 
-# Call Schema 
+async def gpt_4o_mini_stream(messages, thread_id=None):
+    """
+    流式调用模型，边生成边返回
+
+    调用方停止迭代（例如客户端断开连接导致任务被取消）时会关闭上游连接，模型不再继续生成
+
+    Args:
+        messages: 消息列表
+        thread_id: 线程ID
+
+    Yields:
+        tuple: (事件名, 数据)；token 事件数据为 {"delta"}，结束时为 done 事件
+               {status, result, usage, estimated_cost, thread_id}，出错时为 error 事件
+    """
+    if thread_id is None:
+        thread_id = new_thread_id()
+    cache = get_response_cache()
+    key, request_bytes = request_key("agent", MODEL, messages)
+    if cache is not None:
+        reply = await cache.aget(key, request_bytes)
+        if reply is not None:
+            yield "token", {"delta": reply}
+            yield "done", {"status": 0, "result": reply, "usage": None, "estimated_cost": 0, "thread_id": thread_id, "cached": True}
+            return
+
+    parts = []
+    usage = None
+    try:
+        async with upstream_slot():
+            stream = await get_client().chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                stream=True,
+                # 最后一个分块携带本次请求的 token 用量
+                stream_options={"include_usage": True},
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield "token", {"delta": chunk.choices[0].delta.content}
+    except asyncio.CancelledError:
+        print(f"客户端断开，已取消上游请求: {thread_id}")
+        raise
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        yield "error", {"status": -1, "result": str(e), "estimated_cost": 0, "thread_id": thread_id}
+        return
+
+    reply = "".join(parts).strip()
+    if cache is not None:
+        await cache.aput(key, reply)
+    await trace(thread_id, messages, reply)
+    yield "done", {
+        "status": 0,
+        "result": reply,
+        "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else None,
+        "estimated_cost": estimate_cost(usage) if usage else 0,
+        "thread_id": thread_id
+    }
+
+# Call Schema
 
 class HtmlView(BaseModel):
     x: int
@@ -72,32 +320,45 @@ class HtmlView(BaseModel):
     width: int
     html: str
 
-class ViewRender(BaseModel): 
+class ViewRender(BaseModel):
     views: list[HtmlView]
 
-def call_openai_api(messages, thread_id=None):
+# 结构化输出的 Schema 也是缓存键的一部分，Schema 变化后旧缓存自然失效
+RENDER_SCHEMA = ViewRender.model_json_schema()
+
+async def call_openai_api(messages, thread_id=None):
     # 如果没有提供thread_id，生成一个基于时间的唯一ID
     if thread_id is None:
-        thread_id = f"thread_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-    
-    client = OpenAI()
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=messages,
-        response_format=ViewRender,
-        # 添加回调处理器
-        extra_headers={
-            "langchain_callback_handlers": [tracer],
-            "langchain_metadata": {"thread_id": thread_id}
-        }
-    )
-    response = completion.choices[0].message.parsed
-    return [{"x": view.x, "y": view.y, "height": view.height, "width": view.width, "html": view.html} for view in response.views]
-    
+        thread_id = new_thread_id()
+
+    cache = get_response_cache()
+    key, request_bytes = request_key("render", MODEL, messages, RENDER_SCHEMA)
+    if cache is not None:
+        views = await cache.aget(key, request_bytes)
+        if views is not None:
+            return views
+
+    async def complete():
+        async with upstream_slot():
+            completion = await get_client().beta.chat.completions.parse(
+                model=MODEL,
+                messages=messages,
+                response_format=ViewRender,
+            )
+        response = completion.choices[0].message.parsed
+        await trace(thread_id, messages, completion.choices[0].message.content)
+        views = [{"x": view.x, "y": view.y, "height": view.height, "width": view.width, "html": view.html} for view in response.views]
+        if cache is not None:
+            await cache.aput(key, views)
+        return views
+
+    views, _ = await single_flight.do(key, complete)
+    return views
+
 if __name__ == "__main__":
-    print(gpt_4o_mini([
+    print(asyncio.run(gpt_4o_mini([
         {
             "role": "user",
             "content": "Hello, how are you?"
         }
-    ]))
+    ])))
@@ -1,47 +1,390 @@
 import os
-from flask import Flask, request, jsonify
-from agent import gpt_4o_mini, call_openai_api
+import re
+import json
+import time
+import asyncio
+import traceback
+from contextlib import asynccontextmanager
+from json import JSONDecodeError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+import agent
+from agent import gpt_4o_mini, gpt_4o_mini_stream, call_openai_api
+from response_cache import get_response_cache
+from admission import AdmissionRejected, get_admission_controller, retry_after_header
+from images import MAX_IMAGE_BYTES, MAX_IMAGE_FILES, MAX_UPLOAD_BYTES, image_cache, prepare_messages
 
-app = Flask(__name__)
+AUTH_HEADER_KEY = 'X-API-KEY'
+# 客户端的设备标识，用于按设备限流（所有设备共用同一个 API Key）
+DEVICE_ID_HEADER = 'X-Device-Id'
+DEVICE_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+BACKEND_HOST = os.environ.get("BACKEND_HOST", "127.0.0.1")
+BACKEND_PORT = int(os.environ.get("BACKEND_PORT", 5000))
+# 同时处理的连接数上限，超出时直接返回 503，而不是无限排队
+BACKEND_MAX_CONNECTIONS = int(os.environ.get("BACKEND_MAX_CONNECTIONS", 256))
+# 收到退出信号后等待进行中请求完成的最长时间（秒）
+BACKEND_SHUTDOWN_TIMEOUT = float(os.environ.get("BACKEND_SHUTDOWN_TIMEOUT", 30))
+# 批量渲染：单个批次最多的条目数、同时执行的条目数上限
+RENDER_BATCH_MAX_ITEMS = int(os.environ.get("RENDER_BATCH_MAX_ITEMS", 16))
+RENDER_BATCH_CONCURRENCY = int(os.environ.get("RENDER_BATCH_CONCURRENCY", 4))
 
-@app.route('/render', methods=['POST'])
-def render():
-    AUTH_HEADER_KEY = 'X-API-KEY'
-    AUTH_HEADER_VALUE = os.environ.get('AGENT_API_KEY')
-    req_header_value = request.headers.get(AUTH_HEADER_KEY)
-    if AUTH_HEADER_VALUE is not None and req_header_value != AUTH_HEADER_VALUE:
-        return jsonify({"error": "Unauthorized"}), 401
-    messages = request.json.get('messages')
-    if not messages:
-        return jsonify({"error": "No messages provided"}), 400
-    
-    # 从请求中获取thread_id，如果没有则使用None（会自动生成）
-    thread_id = request.json.get('thread_id')
-    return jsonify(call_openai_api(messages, thread_id))
 
-@app.route('/agent', methods=['POST'])
-def agent():
+@asynccontextmanager
+async def lifespan(app):
+    # 启动时创建共享客户端并预热连接，第一个请求不必再等待 TLS 握手
+    agent.get_client()
+    await agent.warmup()
+    yield
+    # 服务器已停止接收新请求并等待进行中的请求结束，这里释放连接池
+    await agent.close_client()
+    print("后端已停止")
+
+
+def check_auth(request: Request):
+    """
+    校验请求头中的 X-API-KEY
+
+    Returns:
+        JSONResponse: 未授权时返回401响应，否则返回None
+    """
     # Header auth: compare fixed key-value, value from ENV
-    AUTH_HEADER_KEY = 'X-API-KEY'
     AUTH_HEADER_VALUE = os.environ.get('AGENT_API_KEY')
     req_header_value = request.headers.get(AUTH_HEADER_KEY)
     if AUTH_HEADER_VALUE is not None and req_header_value != AUTH_HEADER_VALUE:
-        return jsonify({"error": "Unauthorized"}), 401
-    messages = request.json.get('messages')
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return None
+
+
+def admission_key(request: Request) -> str:
+    """
+    准入控制按调用方限流时使用的标识
+
+    所有设备共用同一个 API Key，按 Key 限流等于全局限流；因此在配置了 AGENT_API_KEY、
+    请求已通过鉴权时使用客户端上报的设备ID，否则（未配置鉴权或没有合法的设备ID）使用客户端地址。
+    未经鉴权的请求头不作为标识，否则随意换一个值就能绕过限流
+
+    Returns:
+        str: 调用方标识
+    """
+    device_id = request.headers.get(DEVICE_ID_HEADER, "")
+    if os.environ.get('AGENT_API_KEY') is not None and DEVICE_ID_RE.match(device_id):
+        return f"device:{device_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def admit(request: Request, cost: int = 1):
+    """
+    准入控制：按调用方（设备ID或客户端地址）和模型限流，需在 check_auth 之后调用
+
+    Args:
+        cost: 消耗的令牌数
+
+    Returns:
+        JSONResponse: 被拒绝时返回429响应（带 Retry-After），否则返回None
+    """
+    try:
+        await get_admission_controller().acquire(admission_key(request), agent.MODEL, cost)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            {"error": "Too Many Requests", "reason": e.reason, "retry_after": e.retry_after},
+            status_code=429,
+            headers={"Retry-After": retry_after_header(e)},
+        )
+    return None
+
+
+async def read_body(request: Request):
+    """
+    读取JSON请求体
+
+    Returns:
+        tuple: (请求体, 错误响应)
+    """
+    try:
+        body = await request.json()
+    except (JSONDecodeError, UnicodeDecodeError):
+        return None, JSONResponse({"error": "Invalid JSON"}, status_code=400)
+    if not isinstance(body, dict):
+        return None, JSONResponse({"error": "Invalid JSON"}, status_code=400)
+    return body, None
+
+
+async def read_messages(request: Request):
+    """
+    读取请求体中的 messages 和 thread_id
+
+    Returns:
+        tuple: (messages, thread_id, 错误响应)
+    """
+    body, error = await read_body(request)
+    if error is not None:
+        return None, None, error
+    messages = body.get('messages')
     if not messages:
-        return jsonify({"error": "No messages provided"}), 400
-    
+        return None, None, JSONResponse({"error": "No messages provided"}, status_code=400)
     # 从请求中获取thread_id，如果没有则使用None（会自动生成）
-    thread_id = request.json.get('thread_id')
-    return jsonify(gpt_4o_mini(messages, thread_id))
+    return messages, body.get('thread_id'), None
+
+
+async def read_render_request(request: Request):
+    """
+    读取 /render 请求，支持两种格式：
+        - application/json：{"messages", "thread_id"}，图片以 base64 data URL 内嵌
+        - multipart/form-data：payload 字段为上述JSON，其余文件字段为图片原始字节，
+          消息中可用 attachment://字段名 引用，未引用的图片追加到最后一条用户消息
+
+    Returns:
+        tuple: (messages, attachments, thread_id, 错误响应)
+    """
+    attachments = {}
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # 在读取请求体之前检查大小，超限的上传不会被写入临时文件
+        try:
+            content_length = int(request.headers["content-length"])
+        except (KeyError, ValueError):
+            return None, None, None, JSONResponse({"error": "Content-Length required"}, status_code=411)
+        if content_length > MAX_UPLOAD_BYTES:
+            return None, None, None, JSONResponse({"error": "Request too large"}, status_code=413)
+        try:
+            form = await request.form(max_files=MAX_IMAGE_FILES, max_fields=MAX_IMAGE_FILES, max_part_size=MAX_UPLOAD_BYTES)
+        except Exception as e:
+            return None, None, None, JSONResponse({"error": f"Invalid multipart body: {e}"}, status_code=400)
+        try:
+            try:
+                payload = json.loads(form.get("payload") or "{}")
+            except (TypeError, JSONDecodeError):
+                return None, None, None, JSONResponse({"error": "Invalid JSON"}, status_code=400)
+            for name, value in form.multi_items():
+                if isinstance(value, UploadFile):
+                    if value.size is not None and value.size > MAX_IMAGE_BYTES:
+                        return None, None, None, JSONResponse({"error": f"Image too large: {name}"}, status_code=413)
+                    attachments[name] = await value.read()
+        finally:
+            # 释放 multipart 解析时写入的临时文件
+            await form.close()
+        messages = payload.get('messages') if isinstance(payload, dict) else None
+        if not messages:
+            return None, None, None, JSONResponse({"error": "No messages provided"}, status_code=400)
+        thread_id = payload.get('thread_id')
+    else:
+        messages, thread_id, error = await read_messages(request)
+        if error is not None:
+            return None, None, None, error
+    return messages, attachments, thread_id, None
+
+
+async def render(request: Request):
+    error = check_auth(request)
+    if error is not None:
+        return error
+    messages, attachments, thread_id, error = await read_render_request(request)
+    if error is not None:
+        return error
+    error = await admit(request)
+    if error is not None:
+        return error
+    # 放行后再解码、缩小图片，被拒绝的请求不消耗这部分CPU
+    try:
+        messages = await prepare_messages(messages, attachments)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse(await call_openai_api(messages, thread_id))
+
+
+async def render_batch_item(index: int, item, limit: asyncio.Semaphore) -> dict:
+    """
+    执行批次中的一个渲染请求
+
+    Args:
+        index: 条目在批次中的位置
+        item: {"messages", "thread_id"}
+        limit: 批次内的并发限制
 
-@app.route('/', methods=['GET'])
-def index():
-    import time
-    return jsonify({
+    Returns:
+        dict: {index, status, result, elapsed_ms}；失败时 status 为 -1、result 为错误信息
+    """
+    messages = item.get('messages') if isinstance(item, dict) else None
+    if not messages:
+        return {"index": index, "status": -1, "result": "No messages provided", "elapsed_ms": 0.0}
+    async with limit:
+        started = time.perf_counter()
+        try:
+            messages = await prepare_messages(messages)
+            result = await call_openai_api(messages, item.get('thread_id'))
+            status = 0
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            result = traceback.format_exc()
+            status = -1
+    return {"index": index, "status": status, "result": result, "elapsed_ms": (time.perf_counter() - started) * 1000}
+
+
+async def wait_for_disconnect(request: Request):
+    """请求体已读完后，等待客户端断开连接（收到 http.disconnect）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def render_batch(request: Request):
+    error = check_auth(request)
+    if error is not None:
+        return error
+    body, error = await read_body(request)
+    if error is not None:
+        return error
+    items = body.get('requests')
+    if not isinstance(items, list) or not items:
+        return JSONResponse({"error": "No requests provided"}, status_code=400)
+    if len(items) > RENDER_BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"Too many requests (max {RENDER_BATCH_MAX_ITEMS})"}, status_code=400)
+    # 客户端可以要求更低的并发，但不能超过服务端上限
+    concurrency = body.get('concurrency') or RENDER_BATCH_CONCURRENCY
+    # bool 是 int 的子类，true/false 不算合法的并发数
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        return JSONResponse({"error": "Invalid concurrency"}, status_code=400)
+    error = await admit(request, len(items))
+    if error is not None:
+        return error
+    limit = asyncio.Semaphore(min(concurrency, RENDER_BATCH_CONCURRENCY))
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(render_batch_item(i, item, limit)) for i, item in enumerate(items)]
+
+    def summary(results) -> dict:
+        return {
+            "items": len(results),
+            "failed": sum(1 for r in results if r["status"] != 0),
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+        }
+
+    if not body.get('stream'):
+        gathered = asyncio.ensure_future(asyncio.gather(*tasks))
+        disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+        await asyncio.wait({gathered, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        disconnected.cancel()
+        if not gathered.done():
+            # 客户端已断开，与流式模式一样取消尚未完成的条目
+            print(f"客户端断开，取消批量渲染中未完成的 {sum(1 for t in tasks if not t.done())} 个条目")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(gathered, return_exceptions=True)
+            return JSONResponse({"error": "Client disconnected"}, status_code=499)
+        results = gathered.result()
+        return JSONResponse({"results": results, **summary(results)})
+
+    async def events():
+        # 每完成一个条目就发送一个 item 事件（按完成顺序，带 index），最后发送 done
+        results = []
+        try:
+            for done in asyncio.as_completed(tasks):
+                result = await done
+                results.append(result)
+                yield sse_event("item", result)
+            yield sse_event("done", summary(results))
+        finally:
+            # 客户端断开时取消尚未完成的条目
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+async def agent_endpoint(request: Request):
+    error = check_auth(request)
+    if error is not None:
+        return error
+    messages, thread_id, error = await read_messages(request)
+    if error is not None:
+        return error
+    error = await admit(request)
+    if error is not None:
+        return error
+    return JSONResponse(await gpt_4o_mini(messages, thread_id))
+
+
+def sse_event(event: str, data) -> str:
+    """
+    编码一条 Server-Sent Events 消息
+
+    Args:
+        event: 事件名
+        data: 可JSON序列化的数据
+
+    Returns:
+        str: SSE 文本
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def agent_stream(request: Request):
+    error = check_auth(request)
+    if error is not None:
+        return error
+    messages, thread_id, error = await read_messages(request)
+    if error is not None:
+        return error
+    error = await admit(request)
+    if error is not None:
+        return error
+
+    async def events():
+        # 客户端断开时 Starlette 会取消这个生成器，gpt_4o_mini_stream 随之关闭上游连接
+        async for event, data in gpt_4o_mini_stream(messages, thread_id):
+            yield sse_event(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # 禁止反向代理缓冲，保证每个 token 立即送达
+        "X-Accel-Buffering": "no",
+    })
+
+
+async def metrics(request: Request):
+    error = check_auth(request)
+    if error is not None:
+        return error
+    cache = get_response_cache()
+    return JSONResponse({
+        "response_cache": cache.stats() if cache is not None else None,
+        "single_flight": agent.single_flight.stats(),
+        "admission": get_admission_controller().stats(),
+        "images": image_cache.stats(),
+    })
+
+
+async def index(request: Request):
+    return JSONResponse({
         "timestamp": int(time.time()),
         "version": "0.0.1"
     })
 
+
+app = Starlette(
+    routes=[
+        Route('/render', render, methods=['POST']),
+        Route('/render/batch', render_batch, methods=['POST']),
+        Route('/agent', agent_endpoint, methods=['POST']),
+        Route('/agent/stream', agent_stream, methods=['POST']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/', index, methods=['GET']),
+    ],
+    lifespan=lifespan,
+)
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=BACKEND_HOST,
+        port=BACKEND_PORT,
+        limit_concurrency=BACKEND_MAX_CONNECTIONS,
+        timeout_graceful_shutdown=BACKEND_SHUTDOWN_TIMEOUT,
+    )
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+
+def fake_request(base: str, path: str, method: str = "GET") -> dict:
+    with urllib.request.urlopen(urllib.request.Request(base + path, method=method), timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def start_fake_server(port: int, latency: float) -> subprocess.Popen:
+    """
+    启动本地 OpenAI 替身服务器并等待就绪
+
+    Returns:
+        subprocess.Popen: 服务器进程
+    """
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_openai.py"),
+         "--port", str(port), "--latency", str(latency)],
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            fake_request(base, "/stats")
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("替身服务器启动失败")
+
+
+async def run_level(agent, base: str, endpoint: str, duplicates: int) -> dict:
+    """
+    同时发起 duplicates 个完全相同的请求，统计实际到达上游的调用数
+
+    Returns:
+        dict: 一行结果
+    """
+    fake_request(base, "/stats/reset", "POST")
+    before = dict(agent.single_flight.stats())
+    messages = [{"role": "user", "content": f"bench {endpoint} {duplicates} {time.time()}"}]
+    call = agent.gpt_4o_mini if endpoint == "agent" else agent.call_openai_api
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call(messages, f"bench_{i}") for i in range(duplicates)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for r in results if isinstance(r, Exception) or (isinstance(r, dict) and r.get("status") == -1))
+    after = agent.single_flight.stats()
+    return {
+        "endpoint": endpoint,
+        "single_flight": bool(agent.single_flight.enabled),
+        "duplicates": duplicates,
+        "upstream_calls": fake_request(base, "/stats")["requests"],
+        "coalesced": after["coalesced"] - before["coalesced"],
+        "errors": errors,
+        "wall_ms": elapsed * 1000,
+    }
+
+
+async def main(args) -> list:
+    # 关闭响应缓存，只测量请求合并的效果
+    os.environ.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.port}/v1",
+        OPENAI_API_KEY="fake",
+        RESPONSE_CACHE="0",
+        BACKEND_TRACE="0",
+    )
+    import agent
+
+    base = f"http://127.0.0.1:{args.port}"
+    rows = []
+    modes = [1, 0] if args.baseline else [1]
+    try:
+        for enabled in modes:
+            agent.single_flight.enabled = enabled
+            for endpoint in args.endpoints:
+                for duplicates in args.duplicates:
+                    rows.append(await run_level(agent, base, endpoint, duplicates))
+    finally:
+        await agent.close_client()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="相同请求并发时的上游调用数测试（single-flight）")
+    parser.add_argument("--duplicates", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="同时发起的相同请求数")
+    parser.add_argument("--endpoints", nargs="+", default=["render", "agent"], choices=["render", "agent"])
+    parser.add_argument("--latency", type=float, default=0.5, help="替身服务器的响应延迟（秒）")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--baseline", action="store_true", help="同时测量关闭 single-flight 时的结果作对比")
+    parser.add_argument("--json", help="把结果写入该JSON文件")
+    args = parser.parse_args()
+
+    server = start_fake_server(args.port, args.latency)
+    try:
+        rows = asyncio.run(main(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'接口':<8}{'合并':<6}{'并发相同请求':>12}{'上游调用':>10}{'被合并':>8}{'失败':>6}{'耗时ms':>10}")
+    for row in rows:
+        print(f"{row['endpoint']:<8}{'开' if row['single_flight'] else '关':<6}{row['duplicates']:>12}"
+              f"{row['upstream_calls']:>10}{row['coalesced']:>8}{row['errors']:>6}{row['wall_ms']:>10.0f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
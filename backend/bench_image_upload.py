@@ -0,0 +1,160 @@
+import io
+import json
+import time
+import base64
+import asyncio
+import argparse
+import statistics
+import numpy as np
+from PIL import Image
+from starlette.requests import Request
+
+import images
+from images import estimate_image_tokens, prepare_messages
+
+RESOLUTIONS = {
+    "12mp": (4032, 3024),
+    "1080p": (1920, 1080),
+    "720p": (1280, 720),
+}
+PROMPT = "请根据这张图片生成合适的小组件"
+BOUNDARY = "----bench-boundary-7MA4YWxkTrZu0gW"
+
+
+def synthetic_photo(width: int, height: int, seed: int = 0) -> bytes:
+    """
+    生成类似手机照片的测试图（渐变 + 色块 + 传感器噪声），按 iOS jpegData(compressionQuality: 0.8) 编码
+
+    Returns:
+        bytes: JPEG 数据
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    ones = np.ones((height, width), dtype=np.float32)
+    frame = np.stack([x * 180 + y * 40, y * 160 + 40 * ones, (1 - x) * 120 + 60 * ones], axis=-1)
+    for _ in range(12):
+        x0, y0 = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 50))
+        frame[y0:y0 + height // 6, x0:x0 + width // 6] = rng.integers(0, 255, 3)
+    frame += rng.normal(0, 6, frame.shape)
+    img = Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+
+def json_body(photo: bytes) -> bytes:
+    """当前客户端的请求：图片 base64 后内嵌在 JSON 中"""
+    return json.dumps({"messages": [{"role": "user", "content": [
+        {"type": "text", "text": PROMPT},
+        {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(photo).decode("ascii")}},
+    ]}]}).encode("utf-8")
+
+
+def multipart_body(photo: bytes) -> bytes:
+    """multipart 请求：payload 字段为JSON，图片以原始字节上传"""
+    payload = json.dumps({"messages": [{"role": "user", "content": [
+        {"type": "text", "text": PROMPT},
+        {"type": "image_url", "image_url": {"url": "attachment://frame"}},
+    ]}]})
+    return b"".join([
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"payload\"\r\n\r\n{payload}\r\n".encode("utf-8"),
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"frame\"; filename=\"frame.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n".encode("utf-8"),
+        photo,
+        f"\r\n--{BOUNDARY}--\r\n".encode("utf-8"),
+    ])
+
+
+def make_request(body: bytes, content_type: str) -> Request:
+    """构造与 uvicorn 传给应用相同的 ASGI 请求（按 64KB 分块送达）"""
+    chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)] or [b""]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/render",
+        "headers": [(b"content-type", content_type.encode("latin-1")), (b"content-length", str(len(body)).encode())],
+    }
+    return Request(scope, receive)
+
+
+async def parse_json(body: bytes):
+    """当前流程：解析整个JSON，图片原样转发"""
+    request = make_request(body, "application/json")
+    payload = await request.json()
+    return payload["messages"]
+
+
+async def parse_multipart(body: bytes):
+    """新流程：解析 multipart，图片解码一次并按 token 预算缩小"""
+    request = make_request(body, f"multipart/form-data; boundary={BOUNDARY}")
+    form = await request.form()
+    payload = json.loads(form["payload"])
+    attachments = {"frame": await form["frame"].read()}
+    await form.close()
+    return await prepare_messages(payload["messages"], attachments)
+
+
+def upstream_image_tokens(messages: list) -> int:
+    """按消息中图片的实际尺寸估算上游 token"""
+    tokens = 0
+    for message in messages:
+        for part in message["content"]:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+                with Image.open(io.BytesIO(data)) as img:
+                    tokens += estimate_image_tokens(img.width, img.height)
+    return tokens
+
+
+async def measure(name: str, parse, body: bytes, repeat: int, cold: bool) -> dict:
+    samples = []
+    messages = None
+    for _ in range(repeat):
+        if cold:
+            images.image_cache = images.PreparedImageCache()
+        started = time.perf_counter()
+        messages = await parse(body)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "mode": name,
+        "request_bytes": len(body),
+        "parse_ms": statistics.median(samples),
+        "upstream_bytes": len(json.dumps(messages)),
+        "upstream_image_tokens": upstream_image_tokens(messages),
+    }
+
+
+async def run(resolutions, repeat: int) -> list:
+    rows = []
+    for resolution in resolutions:
+        photo = synthetic_photo(*RESOLUTIONS[resolution])
+        for row in (
+            await measure("json-base64", parse_json, json_body(photo), repeat, cold=False),
+            await measure("multipart", parse_multipart, multipart_body(photo), repeat, cold=True),
+            await measure("multipart-cached", parse_multipart, multipart_body(photo), repeat, cold=False),
+        ):
+            rows.append({"resolution": resolution, **row})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/render 图片上传方式对比：请求大小、解析耗时、上游 token")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--repeat", type=int, default=5, help="每个组合重复次数（取中位数）")
+    parser.add_argument("--json", help="把结果写入该JSON文件")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args.resolutions, args.repeat))
+    print(f"{'分辨率':<8}{'方式':<18}{'请求KB':>10}{'解析+处理ms':>14}{'上游KB':>10}{'图片token':>10}")
+    for row in rows:
+        print(f"{row['resolution']:<8}{row['mode']:<18}{row['request_bytes'] / 1024:>10.0f}{row['parse_ms']:>14.1f}"
+              f"{row['upstream_bytes'] / 1024:>10.0f}{row['upstream_image_tokens']:>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,384 @@
+import io
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = {
+    "agent": "/agent",
+    "agent-stream": "/agent/stream",
+    "render": "/render",
+}
+
+
+class HttpConnection:
+    """
+    基于 asyncio streams 的最小 HTTP/1.1 客户端（keep-alive）
+
+    压测端不能成为瓶颈：每个并发槽位复用一个连接，不为每个请求创建线程或新连接
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers: Optional[dict] = None):
+        """
+        发送请求并读取完整响应
+
+        Returns:
+            tuple: (状态码, 响应体, 首字节耗时秒数)；首字节指响应体的第一个字节，流式响应即第一个事件
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        started = time.perf_counter()
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        ttfb = None
+        chunks = []
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                await self.reader.readexactly(2)
+        else:
+            length = int(response_headers.get("content-length", 0))
+            if length:
+                chunks.append(await self.reader.readexactly(length))
+            ttfb = time.perf_counter() - started
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, b"".join(chunks), ttfb
+
+
+def sample_image(width: int = 1280, height: int = 720) -> str:
+    """
+    生成一张用于 /render 的测试图（JPEG data URL）
+    """
+    from PIL import Image
+
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=80)
+    return "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def request_body(endpoint: str, seq: int, image: Optional[str]) -> bytes:
+    """每个请求的内容都不同，避免被响应缓存或请求合并吸收"""
+    text = f"bench_load {endpoint} #{seq} {time.time()}"
+    if endpoint == "render" and image is not None:
+        content = [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": image}}]
+    else:
+        content = text
+    return json.dumps({"messages": [{"role": "user", "content": content}], "thread_id": f"bench_{seq}"}).encode("utf-8")
+
+
+def classify(endpoint: str, status: int, body: bytes) -> Optional[str]:
+    """
+    判断一次请求是否失败
+
+    Returns:
+        str: 错误类型（http_状态码 / upstream），成功时返回None
+    """
+    if status != 200:
+        return f"http_{status}"
+    if endpoint == "agent-stream":
+        # 上游出错时仍是 200，以 error 事件结束
+        return "upstream" if b"event: error" in body else None
+    try:
+        result = json.loads(body)
+    except ValueError:
+        return "invalid_response"
+    # /agent 返回 {status, ...}；/render 成功时直接返回组件列表，失败时为 5xx
+    if isinstance(result, dict) and result.get("status") != 0:
+        return "upstream"
+    return None
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(samples: list) -> dict:
+    """把毫秒样本汇总为分位数"""
+    return {
+        "p50": round(percentile(samples, 0.50), 2),
+        "p95": round(percentile(samples, 0.95), 2),
+        "p99": round(percentile(samples, 0.99), 2),
+        "max": round(max(samples), 2) if samples else 0.0,
+        "mean": round(sum(samples) / len(samples), 2) if samples else 0.0,
+    }
+
+
+def http_json(url: str, method: str = "GET") -> dict:
+    with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+async def run_level(args, endpoint: str, concurrency: int, image: Optional[str]) -> dict:
+    """
+    以固定并发（闭环：每个槽位收到响应后立即发下一个请求）压测一个接口 duration 秒
+
+    Returns:
+        dict: 一行结果
+    """
+    fake_base = f"http://127.0.0.1:{args.fake_port}"
+    await asyncio.to_thread(http_json, fake_base + "/stats/reset", "POST")
+    path = ENDPOINTS[endpoint]
+    headers = {"Content-Type": "application/json"}
+    latencies, ttfbs, errors = [], [], {}
+    seq = 0
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def worker(slot: int):
+        nonlocal seq
+        conn = HttpConnection("127.0.0.1", args.port)
+        try:
+            while time.perf_counter() < deadline:
+                seq += 1
+                body = request_body(endpoint, seq, image)
+                sent = time.perf_counter()
+                try:
+                    status, payload, ttfb = await conn.request("POST", path, body, headers)
+                    kind = classify(endpoint, status, payload)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    await conn.close()
+                    kind, ttfb = "connection", None
+                latencies.append((time.perf_counter() - sent) * 1000)
+                if kind is not None:
+                    errors[kind] = errors.get(kind, 0) + 1
+                elif ttfb is not None:
+                    ttfbs.append(ttfb * 1000)
+        finally:
+            await conn.close()
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    failed = sum(errors.values())
+    upstream = await asyncio.to_thread(http_json, fake_base + "/stats")
+    row = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": failed,
+        "error_rate": round(failed / len(latencies), 4) if latencies else 0.0,
+        "error_kinds": dict(sorted(errors.items())),
+        # 只有成功的请求计入吞吐
+        "throughput_rps": round((len(latencies) - failed) / elapsed, 2),
+        "latency_ms": summarize(latencies),
+        "upstream_requests": upstream["requests"],
+        "upstream_errors": upstream["errors"],
+    }
+    if endpoint == "agent-stream":
+        row["ttfb_ms"] = summarize(ttfbs)
+    return row
+
+
+def wait_ready(url: str, process: subprocess.Popen, name: str):
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} 启动失败（退出码 {process.returncode}）")
+        try:
+            http_json(url)
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{name} 启动超时")
+
+
+def start_servers(args):
+    """
+    启动 OpenAI 替身服务器和后端（各自独立进程，与压测端不争抢 GIL）
+
+    Returns:
+        tuple: (替身进程, 后端进程)
+    """
+    output = None if args.verbose else subprocess.DEVNULL
+    fake_env = dict(os.environ)
+    fake_env.update(
+        FAKE_LATENCY=str(args.latency),
+        FAKE_LATENCY_DIST=args.latency_dist,
+        FAKE_LATENCY_JITTER=str(args.jitter),
+        FAKE_ERROR_RATE=str(args.error_rate),
+        FAKE_ERROR_STATUS=str(args.error_status),
+        FAKE_TOKEN_INTERVAL=str(args.token_interval),
+    )
+    if args.seed is not None:
+        fake_env["FAKE_SEED"] = str(args.seed)
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "fake_openai.py"), "--port", str(args.fake_port)],
+        env=fake_env, stdout=output, stderr=output,
+    )
+
+    backend_env = dict(os.environ)
+    backend_env.pop("AGENT_API_KEY", None)
+    backend_env.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.fake_port}/v1",
+        OPENAI_API_KEY="fake",
+        BACKEND_HOST="127.0.0.1",
+        BACKEND_PORT=str(args.port),
+        BACKEND_TRACE="0",
+    )
+    # 默认关闭响应缓存、放开准入限流，测量的是后端本身；已在环境变量中设置的值优先
+    for name, value in (
+        ("RESPONSE_CACHE", "0"),
+        ("KEY_RATE", "1000000"),
+        ("KEY_BURST", "1000000"),
+        ("MODEL_RATE", "1000000"),
+        ("MODEL_BURST", "1000000"),
+        ("BACKEND_MAX_CONNECTIONS", str(max(256, max(args.concurrency) * 2))),
+    ):
+        backend_env.setdefault(name, value)
+    try:
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/stats", fake, "替身服务器")
+        backend = subprocess.Popen(
+            [sys.executable, os.path.join(BACKEND_DIR, "app.py")],
+            cwd=BACKEND_DIR, env=backend_env, stdout=output, stderr=output,
+        )
+    except Exception:
+        fake.terminate()
+        raise
+    try:
+        wait_ready(f"http://127.0.0.1:{args.port}/", backend, "后端")
+    except Exception:
+        backend.terminate()
+        fake.terminate()
+        raise
+    return fake, backend
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(rows: list, baseline_path: str):
+    """
+    与之前保存的结果逐行对比，打印吞吐和分位数的相对变化
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\n对比 {baseline_path}（正数表示变好）")
+    print(f"{'接口':<14}{'并发':>6}{'吞吐':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'错误率':>10}")
+    for row in rows:
+        old = baseline.get((row["endpoint"], row["concurrency"]))
+        if old is None:
+            continue
+
+        def change(new_value: float, old_value: float, lower_is_better: bool) -> str:
+            if not old_value:
+                return "-"
+            delta = (new_value - old_value) / old_value * 100
+            return f"{-delta if lower_is_better else delta:+.1f}%"
+
+        cells = [change(row["throughput_rps"], old["throughput_rps"], False)]
+        cells += [change(row["latency_ms"][p], old["latency_ms"][p], True) for p in ("p50", "p95", "p99")]
+        cells.append(change(row["error_rate"], old["error_rate"], True))
+        print(f"{row['endpoint']:<14}{row['concurrency']:>6}" + "".join(f"{c:>10}" for c in cells))
+
+
+async def main(args) -> dict:
+    image = sample_image() if args.render_image else None
+    fake, backend = start_servers(args)
+    rows = []
+    try:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                row = await run_level(args, endpoint, concurrency, image)
+                rows.append(row)
+                print(f"{endpoint:<14}{concurrency:>6}{row['requests']:>8}{row['throughput_rps']:>10.1f}"
+                      f"{row['latency_ms']['p50']:>10.1f}{row['latency_ms']['p95']:>10.1f}"
+                      f"{row['latency_ms']['p99']:>10.1f}{row['error_rate'] * 100:>9.1f}%", flush=True)
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+    return {
+        "revision": git_revision(),
+        "config": {
+            "duration": args.duration,
+            "latency": args.latency,
+            "latency_dist": args.latency_dist,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "error_status": args.error_status,
+            "token_interval": args.token_interval,
+            "render_image": args.render_image,
+        },
+        "results": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后端压测：本地 OpenAI 替身 + 固定并发，输出吞吐、延迟分位数和错误率")
+    parser.add_argument("--endpoints", nargs="+", default=["agent", "render"], choices=list(ENDPOINTS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32, 64], help="并发级别")
+    parser.add_argument("--duration", type=float, default=10, help="每个并发级别的压测时长（秒）")
+    parser.add_argument("--latency", type=float, default=0.5, help="替身的响应延迟中位数（秒）")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--jitter", type=float, default=0.3, help="uniform 的半宽（秒）或 lognormal 的 sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身返回错误的比例（0-1）")
+    parser.add_argument("--error-status", type=int, default=429, choices=[429, 500])
+    parser.add_argument("--token-interval", type=float, default=0.02, help="流式响应的 token 间隔（秒）")
+    parser.add_argument("--render-image", action="store_true", help="/render 请求附带一张 1280x720 的图片")
+    parser.add_argument("--seed", type=int, default=0, help="替身的随机数种子")
+    parser.add_argument("--port", type=int, default=5100, help="后端端口")
+    parser.add_argument("--fake-port", type=int, default=9100, help="替身服务器端口")
+    parser.add_argument("--json", help="把结果写入该JSON文件")
+    parser.add_argument("--compare", help="与之前 --json 保存的结果对比")
+    parser.add_argument("--verbose", action="store_true", help="显示两个服务器的输出")
+    args = parser.parse_args()
+
+    print(f"{'接口':<14}{'并发':>6}{'请求数':>8}{'吞吐/s':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'错误率':>10}")
+    report = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(report["results"], args.compare)
@@ -0,0 +1,187 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# 本地的 OpenAI 替身：实现 chat.completions（含结构化输出）和 models 接口，用于压测和本地联调，不产生费用
+FAKE_LATENCY = float(os.environ.get("FAKE_LATENCY", 0.5))
+FAKE_PROMPT_TOKENS = int(os.environ.get("FAKE_PROMPT_TOKENS", 800))
+FAKE_COMPLETION_TOKENS = int(os.environ.get("FAKE_COMPLETION_TOKENS", 120))
+# 流式响应中相邻两个 token 的间隔（秒）；FAKE_LATENCY 即首个 token 的延迟
+FAKE_TOKEN_INTERVAL = float(os.environ.get("FAKE_TOKEN_INTERVAL", 0.02))
+# 延迟分布：fixed 固定为 FAKE_LATENCY；uniform 在 FAKE_LATENCY ± FAKE_LATENCY_JITTER 内均匀分布；
+# lognormal 以 FAKE_LATENCY 为中位数、FAKE_LATENCY_JITTER 为 sigma（长尾，接近真实接口）
+FAKE_LATENCY_DIST = os.environ.get("FAKE_LATENCY_DIST", "fixed")
+FAKE_LATENCY_JITTER = float(os.environ.get("FAKE_LATENCY_JITTER", 0.5))
+# 按该比例返回 FAKE_ERROR_STATUS（429 或 500）和 OpenAI 格式的错误
+FAKE_ERROR_RATE = float(os.environ.get("FAKE_ERROR_RATE", 0))
+FAKE_ERROR_STATUS = int(os.environ.get("FAKE_ERROR_STATUS", 429))
+# 随机数种子，便于多次压测之间对比
+FAKE_SEED = os.environ.get("FAKE_SEED")
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+ERRORS = {
+    429: ("Rate limit reached for requests", "requests", "rate_limit_exceeded"),
+    500: ("The server had an error while processing your request.", "server_error", None),
+}
+
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "streams_cancelled": 0, "errors": 0}
+rng = random.Random(FAKE_SEED)
+
+
+def sample_latency() -> float:
+    """
+    按 FAKE_LATENCY_DIST 抽取一次响应延迟
+
+    Returns:
+        float: 延迟秒数（不小于0）
+    """
+    if FAKE_LATENCY_DIST == "uniform":
+        return max(0.0, rng.uniform(FAKE_LATENCY - FAKE_LATENCY_JITTER, FAKE_LATENCY + FAKE_LATENCY_JITTER))
+    if FAKE_LATENCY_DIST == "lognormal" and FAKE_LATENCY > 0:
+        return rng.lognormvariate(math.log(FAKE_LATENCY), FAKE_LATENCY_JITTER)
+    return FAKE_LATENCY
+
+
+def fake_error():
+    """
+    按 FAKE_ERROR_RATE 决定是否返回错误
+
+    Returns:
+        JSONResponse: 需要出错时返回 OpenAI 格式的错误响应，否则返回None
+    """
+    if FAKE_ERROR_RATE <= 0 or rng.random() >= FAKE_ERROR_RATE:
+        return None
+    stats["errors"] += 1
+    message, error_type, code = ERRORS.get(FAKE_ERROR_STATUS, ERRORS[500])
+    return JSONResponse(
+        {"error": {"message": message, "type": error_type, "param": None, "code": code}},
+        status_code=FAKE_ERROR_STATUS,
+    )
+
+
+def fake_content(body: dict) -> str:
+    """
+    按请求生成回复内容：要求结构化输出时返回符合 ViewRender 的JSON，否则返回一段文本
+    """
+    if body.get("response_format"):
+        return json.dumps({"views": [{"x": 0, "y": 0, "height": 200, "width": 300, "html": "<div>fake</div>"}]})
+    return "fake reply"
+
+
+def usage() -> dict:
+    return {
+        "prompt_tokens": FAKE_PROMPT_TOKENS,
+        "completion_tokens": FAKE_COMPLETION_TOKENS,
+        "total_tokens": FAKE_PROMPT_TOKENS + FAKE_COMPLETION_TOKENS,
+    }
+
+
+async def stream_completion(body: dict):
+    """按 OpenAI 的 SSE 格式逐个 token 返回；客户端提前断开时计入 streams_cancelled"""
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    chunk = {
+        "id": f"chatcmpl-fake-{stats['requests']}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+    }
+    try:
+        await asyncio.sleep(sample_latency())
+        for i in range(FAKE_COMPLETION_TOKENS):
+            if i:
+                await asyncio.sleep(FAKE_TOKEN_INTERVAL)
+            delta = {"content": f"tok{i} "}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+        yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage()})}\n\n"
+        yield "data: [DONE]\n\n"
+    except asyncio.CancelledError:
+        stats["streams_cancelled"] += 1
+        raise
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    error = fake_error()
+    if error is not None:
+        # 与真实接口一样，限流和服务端错误很快返回
+        return error
+    if body.get("stream"):
+        return StreamingResponse(stream_completion(body), media_type="text/event-stream")
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(sample_latency())
+        return JSONResponse({
+            "id": f"chatcmpl-fake-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": fake_content(body)},
+            }],
+            "usage": usage(),
+        })
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def models(request: Request):
+    return JSONResponse({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]})
+
+
+async def get_stats(request: Request):
+    return JSONResponse(stats)
+
+
+async def reset_stats(request: Request):
+    stats.update(requests=0, errors=0, streams_cancelled=0, max_in_flight=stats["in_flight"])
+    return JSONResponse(stats)
+
+
+app = Starlette(routes=[
+    Route('/v1/chat/completions', chat_completions, methods=['POST']),
+    Route('/v1/models', models, methods=['GET']),
+    Route('/stats', get_stats, methods=['GET']),
+    Route('/stats/reset', reset_stats, methods=['POST']),
+])
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地 OpenAI 替身服务器（配合 OPENAI_BASE_URL=http://HOST:PORT/v1 使用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=FAKE_LATENCY, help="每个请求的响应延迟（秒，分布的中位数）")
+    parser.add_argument("--latency-dist", default=FAKE_LATENCY_DIST, choices=LATENCY_DISTRIBUTIONS, help="延迟分布")
+    parser.add_argument("--jitter", type=float, default=FAKE_LATENCY_JITTER, help="uniform 的半宽（秒）或 lognormal 的 sigma")
+    parser.add_argument("--error-rate", type=float, default=FAKE_ERROR_RATE, help="返回错误的比例（0-1）")
+    parser.add_argument("--error-status", type=int, default=FAKE_ERROR_STATUS, choices=sorted(ERRORS), help="错误状态码")
+    parser.add_argument("--prompt-tokens", type=int, default=FAKE_PROMPT_TOKENS)
+    parser.add_argument("--completion-tokens", type=int, default=FAKE_COMPLETION_TOKENS)
+    args = parser.parse_args()
+    FAKE_LATENCY = args.latency
+    FAKE_LATENCY_DIST = args.latency_dist
+    FAKE_LATENCY_JITTER = args.jitter
+    FAKE_ERROR_RATE = args.error_rate
+    FAKE_ERROR_STATUS = args.error_status
+    FAKE_PROMPT_TOKENS = args.prompt_tokens
+    FAKE_COMPLETION_TOKENS = args.completion_tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
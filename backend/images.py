@@ -0,0 +1,281 @@
+import io
+import os
+import math
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image, ImageOps
+
+from response_cache import DATA_URL_RE
+
+# 是否在发给模型前缩小并重新编码图片
+IMAGE_PREPARE = int(os.environ.get("IMAGE_PREPARE", 1))
+# 单张图片的 token 预算（按 gpt-4o-mini high detail 的计费方式估算）
+IMAGE_BASE_TOKENS = int(os.environ.get("IMAGE_BASE_TOKENS", 2833))
+IMAGE_TILE_TOKENS = int(os.environ.get("IMAGE_TILE_TOKENS", 5667))
+IMAGE_TOKEN_BUDGET = int(os.environ.get("IMAGE_TOKEN_BUDGET", IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * 4))
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", 80))
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", 64))
+# multipart 上传中单张图片的大小上限
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+# multipart 请求的图片数量上限、整个请求体的大小上限（读取请求体之前按 Content-Length 检查）
+MAX_IMAGE_FILES = int(os.environ.get("MAX_IMAGE_FILES", 8))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", MAX_IMAGE_BYTES + 1024 * 1024))
+# 模型接受的图片格式
+SUPPORTED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+ATTACHMENT_PREFIX = "attachment://"
+
+
+def fit_high_detail(width: int, height: int) -> Tuple[int, int]:
+    """
+    模型在 high detail 模式下实际看到的尺寸：先缩放到 2048x2048 以内，再把短边缩到 768 以内
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    估算一张图片消耗的 token 数
+
+    Args:
+        width: 宽度
+        height: 高度
+
+    Returns:
+        int: 基础 token + 每个 512x512 分块的 token
+    """
+    width, height = fit_high_detail(width, height)
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def target_size(width: int, height: int, budget: int = IMAGE_TOKEN_BUDGET) -> Tuple[int, int]:
+    """
+    计算满足 token 预算的尺寸
+
+    先按模型的缩放规则缩小（超出部分模型本来也看不到），仍超预算时逐步缩小
+
+    Args:
+        width: 原始宽度
+        height: 原始高度
+        budget: token 预算
+
+    Returns:
+        tuple: (宽, 高)
+    """
+    width, height = fit_high_detail(width, height)
+    while estimate_image_tokens(width, height) > budget and min(width, height) > 64:
+        # 缩到刚好少一行/一列分块
+        tiles_w, tiles_h = math.ceil(width / 512), math.ceil(height / 512)
+        if tiles_w >= tiles_h:
+            scale = 512 * (tiles_w - 1) / width if tiles_w > 1 else 0.5
+        else:
+            scale = 512 * (tiles_h - 1) / height if tiles_h > 1 else 0.5
+        width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    return width, height
+
+
+class PreparedImageCache:
+    """
+    已处理图片的缓存，按原始图片字节的摘要索引（LRU）
+
+    同一张图片反复上传时（客户端重试、多个组件共用同一帧）只解码和缩放一次
+    """
+
+    def __init__(self, max_entries: int = IMAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> data URL
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            url = self._entries.get(digest)
+            if url is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return url
+
+    def put(self, digest: str, url: str):
+        with self._lock:
+            self._entries[digest] = url
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, bytes_in: int, bytes_out: int):
+        """记录一次处理前后的字节数"""
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中/未命中次数，处理前后的总字节数
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+            }
+
+
+image_cache = PreparedImageCache()
+
+
+def prepare_image(data: bytes) -> str:
+    """
+    解码一次图片，按 token 预算缩小并重新编码为 JPEG
+
+    Args:
+        data: 原始图片字节
+
+    Returns:
+        str: 可直接放进 OpenAI 消息的 data URL
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    url = image_cache.get(digest)
+    if url is not None:
+        return url
+    with Image.open(io.BytesIO(data)) as img:
+        upright = img.getexif().get(0x0112, 1) == 1  # EXIF Orientation
+        size = target_size(img.width, img.height) if upright else None
+        if upright and img.format == "JPEG" and size == (img.width, img.height):
+            # 已经是预算内的 JPEG，不再重新编码，避免二次压缩损失画质
+            encoded = data
+        else:
+            # JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小；按长边请求，旋转后两个方向都不会小于目标尺寸
+            side = max(target_size(img.width, img.height))
+            img.draft("RGB", (side, side))
+            # 手机拍摄的照片方向记录在 EXIF 中，先转正再缩放
+            img = ImageOps.exif_transpose(img)
+            size = target_size(img.width, img.height)
+            if size != (img.width, img.height):
+                img = img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY)
+            encoded = out.getvalue()
+    url = "data:image/jpeg;base64," + base64.b64encode(encoded).decode("ascii")
+    image_cache.put(digest, url)
+    image_cache.record(len(data), len(encoded))
+    return url
+
+
+def _decode_data_url(url: str) -> Optional[bytes]:
+    match = DATA_URL_RE.match(url)
+    if match is None or not match.group(2) or not match.group(1).lower().startswith("image/"):
+        return None
+    try:
+        return base64.b64decode(url[match.end():])
+    except ValueError:
+        return None
+
+
+def _image_url(data: bytes) -> str:
+    if IMAGE_PREPARE:
+        return prepare_image(data)
+    # 不重新编码时按实际格式标注 MIME 类型；只读取文件头，不解码像素
+    with Image.open(io.BytesIO(data)) as img:
+        mime = SUPPORTED_FORMATS.get(img.format)
+    if mime is None:
+        raise ValueError("Unsupported image format")
+    return f"data:{mime};base64," + base64.b64encode(data).decode("ascii")
+
+
+def _prepare_messages(messages: list, attachments: Dict[str, bytes]) -> list:
+    """在线程中执行：替换消息中的图片，并把未引用的附件追加到最后一条用户消息"""
+    used = set()
+    prepared = []
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if not isinstance(content, list):
+            prepared.append(message)
+            continue
+        parts = []
+        for part in content:
+            is_image = isinstance(part, dict) and part.get("type") == "image_url" and isinstance(part.get("image_url"), dict)
+            url = part["image_url"].get("url", "") if is_image else None
+            if url is None:
+                parts.append(part)
+                continue
+            data = None
+            if url.startswith(ATTACHMENT_PREFIX):
+                name = url[len(ATTACHMENT_PREFIX):]
+                if name not in attachments:
+                    raise ValueError(f"Unknown attachment: {name}")
+                data = attachments[name]
+                used.add(name)
+            elif IMAGE_PREPARE:
+                data = _decode_data_url(url)
+            if data is None:
+                parts.append(part)
+                continue
+            image_url = dict(part["image_url"])
+            image_url["url"] = _image_url(data)
+            parts.append({**part, "image_url": image_url})
+        prepared.append({**message, "content": parts})
+
+    extra = [name for name in attachments if name not in used]
+    if extra:
+        images = [{"type": "image_url", "image_url": {"url": _image_url(attachments[name])}} for name in extra]
+        for i in range(len(prepared) - 1, -1, -1):
+            message = prepared[i]
+            if isinstance(message, dict) and message.get("role") == "user":
+                content = message.get("content")
+                if isinstance(content, str):
+                    content = [{"type": "text", "text": content}]
+                prepared[i] = {**message, "content": list(content or []) + images}
+                break
+        else:
+            prepared.append({"role": "user", "content": images})
+    return prepared
+
+
+async def prepare_messages(messages: list, attachments: Optional[Dict[str, bytes]] = None) -> list:
+    """
+    准备发给模型的消息
+
+    - content 中 url 为 attachment://字段名 的图片替换为对应的上传文件
+    - 没有被引用的上传文件追加到最后一条用户消息
+    - 所有图片（包括 base64 data URL）按 token 预算缩小并重新编码
+
+    解码和缩放在线程中执行，不阻塞事件循环
+
+    Args:
+        messages: 消息列表
+        attachments: multipart 上传的图片，字段名 -> 图片字节
+
+    Returns:
+        list: 新的消息列表（不修改传入的列表）
+
+    Raises:
+        ValueError: 引用了不存在的附件，或图片无法解码
+    """
+    attachments = attachments or {}
+    if not attachments and not IMAGE_PREPARE:
+        return messages
+    try:
+        return await asyncio.to_thread(_prepare_messages, messages, attachments)
+    except (OSError, Image.DecompressionBombError) as e:
+        # Pillow 无法识别图片格式时抛出 OSError 的子类
+        raise ValueError("Invalid image") from e
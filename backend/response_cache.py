@@ -0,0 +1,372 @@
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+# 是否启用响应缓存
+RESPONSE_CACHE = int(os.environ.get("RESPONSE_CACHE", 1))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 512))
+# 缓存有效期（秒）
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 600))
+# 磁盘缓存目录，留空表示只使用内存缓存
+RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", "")
+# 磁盘缓存的总大小上限（字节），超出时淘汰最久未使用的文件
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+# 清理磁盘上过期文件的间隔（秒）
+RESPONSE_CACHE_SWEEP_INTERVAL = float(os.environ.get("RESPONSE_CACHE_SWEEP_INTERVAL", 60))
+
+DATA_URL_RE = re.compile(r"^data:([^;,]*)(;base64)?,", re.IGNORECASE)
+
+
+def _content_digest(url: str) -> str:
+    """
+    计算图片URL的内容摘要
+
+    data URL 按解码后的图片字节计算（base64 换行、填充等写法不同也得到相同结果），普通链接保持原样
+    """
+    match = DATA_URL_RE.match(url)
+    if match is None:
+        return url
+    payload = url[match.end():]
+    if match.group(2):
+        try:
+            data = base64.b64decode(payload)
+        except ValueError:
+            data = payload.encode("utf-8")
+    else:
+        data = payload.encode("utf-8")
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def _normalize(value: Any, sizes: list) -> Any:
+    """把消息转换成规范形式：图片替换为内容摘要，同时累计原始字符串的长度"""
+    if isinstance(value, dict):
+        if value.get("type") == "image_url" and isinstance(value.get("image_url"), dict):
+            image = dict(value["image_url"])
+            url = image.get("url", "")
+            sizes.append(len(url))
+            image["url"] = _content_digest(url)
+            return {**value, "image_url": image}
+        return {key: _normalize(item, sizes) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item, sizes) for item in value]
+    if isinstance(value, str):
+        sizes.append(len(value))
+    return value
+
+
+def request_key(endpoint: str, model: str, messages: list, schema: Optional[dict] = None):
+    """
+    计算请求的缓存键
+
+    只包含影响模型输出的字段（接口、模型、消息、响应结构），不包含 thread_id 等与会话相关的字段
+
+    Args:
+        endpoint: 接口名称（agent / render）
+        model: 模型名称
+        messages: 消息列表
+        schema: 结构化输出的 JSON Schema
+
+    Returns:
+        tuple: (缓存键, 请求正文的大致字节数)
+    """
+    sizes = []
+    canonical = {
+        "endpoint": endpoint,
+        "model": model,
+        "messages": _normalize(messages, sizes),
+        "schema": schema,
+    }
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest(), sum(sizes)
+
+
+class ResponseCache:
+    """
+    上游响应缓存
+
+    - 内存层：按最近使用淘汰（LRU），条目超过 ttl 秒后失效
+    - 磁盘层（可选）：每个键一个JSON文件，进程重启后仍可命中；命中后提升到内存层。
+      总大小超过 disk_max_bytes 时按最近使用淘汰（文件 mtime 记录最近使用时间，重启后顺序不丢），
+      启动时和每隔 sweep_interval 秒清理过期文件
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL, disk_dir: str = RESPONSE_CACHE_DIR,
+                 disk_max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES, sweep_interval: float = RESPONSE_CACHE_SWEEP_INTERVAL):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 内存中最多保留的条目数
+            ttl: 有效期（秒）
+            disk_dir: 磁盘缓存目录，为空时不使用磁盘
+            disk_max_bytes: 磁盘缓存的总大小上限（字节）
+            sweep_interval: 清理过期文件的间隔（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._disk_index = OrderedDict()  # key -> (expires_at, 文件字节数)，按最近使用排序
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_expired = 0
+        self.request_bytes_saved = 0
+        self.response_bytes_saved = 0
+        self._last_sweep = time.monotonic()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, expires_at: float, value: Any, size: int):
+        self._entries[key] = (expires_at, value, size)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘目录：删除过期文件和写了一半的临时文件，按 mtime 重建最近使用顺序"""
+        now = time.time()
+        found = []
+        expired = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".tmp"):
+                # 上次进程退出时没有写完的文件
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            if not entry.name.endswith(".json"):
+                continue
+            key = entry.name[:-len(".json")]
+            try:
+                st = entry.stat()
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    expires_at = json.load(f).get("expires_at", 0)
+            except (OSError, ValueError):
+                expired.append(key)
+                continue
+            if expires_at <= now:
+                expired.append(key)
+                continue
+            found.append((st.st_mtime, key, expires_at, st.st_size))
+        self._remove_files(expired)
+        self.disk_expired += len(expired)
+        for _, key, expires_at, size in sorted(found):
+            self._disk_index[key] = (expires_at, size)
+            self._disk_bytes += size
+        self._remove_files(self._evict_disk())
+
+    def _forget_disk(self, key: str):
+        """从磁盘索引中移除（调用方持有锁）"""
+        item = self._disk_index.pop(key, None)
+        if item is not None:
+            self._disk_bytes -= item[1]
+
+    def _evict_disk(self) -> list:
+        """
+        淘汰最久未使用的文件直到总大小不超过上限（调用方持有锁）
+
+        Returns:
+            list: 需要删除文件的键
+        """
+        evicted = []
+        while self._disk_bytes > self.disk_max_bytes and self._disk_index:
+            key, (_, size) = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(key)
+        self.disk_evictions += len(evicted)
+        return evicted
+
+    def _sweep_expired(self, now: float) -> list:
+        """
+        到了清理间隔时收集所有过期的磁盘条目（调用方持有锁）
+
+        Returns:
+            list: 需要删除文件的键
+        """
+        if time.monotonic() - self._last_sweep < self.sweep_interval:
+            return []
+        self._last_sweep = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._disk_index.items() if expires_at <= now]
+        for key in expired:
+            self._forget_disk(key)
+        self.disk_expired += len(expired)
+        return expired
+
+    def _read_disk(self, key: str):
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget_disk(key)
+            return None
+        if item.get("expires_at", 0) <= time.time():
+            with self._lock:
+                self._forget_disk(key)
+                self.disk_expired += 1
+            self._remove_files([key])
+            return None
+        with self._lock:
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+        try:
+            # mtime 记录最近使用时间，重启后按它恢复淘汰顺序
+            os.utime(path)
+        except OSError:
+            pass
+        return item
+
+    def get(self, key: str, request_bytes: int = 0) -> Optional[Any]:
+        """
+        查找缓存
+
+        Args:
+            key: 缓存键
+            request_bytes: 请求正文字节数，命中时计入节省的上传量
+
+        Returns:
+            缓存的响应；未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value, size = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    self.request_bytes_saved += request_bytes
+                    self.response_bytes_saved += size
+                    return value
+                del self._entries[key]
+        if self.disk_dir:
+            item = self._read_disk(key)
+            if item is not None:
+                with self._lock:
+                    self._remember(key, item["expires_at"], item["value"], item["size"])
+                    self.disk_hits += 1
+                    self.request_bytes_saved += request_bytes
+                    self.response_bytes_saved += item["size"]
+                return item["value"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 可JSON序列化的响应
+        """
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value, size)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": expires_at, "size": size, "value": value}, f, ensure_ascii=False)
+                    file_bytes = f.tell()
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"写入磁盘缓存失败: {e}")
+                return
+            with self._lock:
+                self._forget_disk(key)
+                self._disk_index[key] = (expires_at, file_bytes)
+                self._disk_bytes += file_bytes
+                stale = self._sweep_expired(time.time()) + self._evict_disk()
+            self._remove_files(stale)
+
+    async def aget(self, key: str, request_bytes: int = 0) -> Optional[Any]:
+        """异步查找；启用磁盘层时在线程中读文件，不阻塞事件循环"""
+        if self.disk_dir:
+            return await asyncio.to_thread(self.get, key, request_bytes)
+        return self.get(key, request_bytes)
+
+    async def aput(self, key: str, value: Any):
+        """异步写入；启用磁盘层时在线程中写文件"""
+        if self.disk_dir:
+            await asyncio.to_thread(self.put, key, value)
+        else:
+            self.put(key, value)
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中/未命中次数、命中率、节省的字节数等
+        """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+                "disk_expired": self.disk_expired,
+                "request_bytes_saved": self.request_bytes_saved,
+                "response_bytes_saved": self.response_bytes_saved,
+            }
+
+
+# 全局实例
+_cache_instance = None
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    获取全局响应缓存实例
+
+    Returns:
+        ResponseCache: 缓存实例；RESPONSE_CACHE=0 时返回None
+    """
+    global _cache_instance
+    if not RESPONSE_CACHE:
+        return None
+    if _cache_instance is None:
+        _cache_instance = ResponseCache()
+    return _cache_instance
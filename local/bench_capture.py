@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from capture import FrameEncoder
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "retina": (2880, 1800),
+    "5k": (5120, 2880),
+}
+
+
+def synthetic_screen(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    生成类似桌面截图的测试帧：渐变背景、窗口色块和大量文字
+
+    Args:
+        width: 宽度
+        height: 高度
+        seed: 随机种子
+
+    Returns:
+        np.ndarray: BGR图像
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(60, 200, width, dtype=np.uint8)
+    frame = np.dstack([np.tile(gradient, (height, 1))] * 3)
+    for _ in range(6):
+        x0, y0 = int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))
+        x1, y1 = x0 + int(rng.integers(width // 6, width // 2)), y0 + int(rng.integers(height // 6, height // 2))
+        color = tuple(int(c) for c in rng.integers(180, 255, 3))
+        cv2.rectangle(frame, (x0, y0), (x1, y1), color, -1)
+        for line in range(y0 + 30, y1, max(18, height // 60)):
+            cv2.putText(frame, "The quick brown fox jumps over the lazy dog 0123456789", (x0 + 10, line),
+                        cv2.FONT_HERSHEY_SIMPLEX, max(0.4, height / 2400), (30, 30, 30), 1, cv2.LINE_AA)
+    return frame
+
+
+def legacy_pipeline(frame: np.ndarray, path: str) -> int:
+    """
+    改动前的流程：全分辨率PNG写盘 -> PIL重新打开 -> LANCZOS缩小 -> optimize=True 再次保存
+
+    Returns:
+        int: 输出文件大小
+    """
+    from PIL import Image
+
+    cv2.imwrite(path, frame)  # 近似 screencapture 写出的全分辨率PNG
+    with Image.open(path) as img:
+        resized = img.resize((img.width // 4, img.height // 4), Image.LANCZOS)
+        resized.save(path, optimize=True)
+    return os.path.getsize(path)
+
+
+def time_it(fn, repeat: int) -> float:
+    """返回多次执行的中位耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return float(np.median(samples))
+
+
+def run(resolutions, formats, repeat: int) -> list:
+    """
+    对每个分辨率和格式测量每帧耗时与输出大小
+
+    Returns:
+        list: 结果行
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in resolutions:
+            width, height = RESOLUTIONS[name]
+            frame = synthetic_screen(width, height)
+            path = os.path.join(tmp_dir, "legacy.png")
+            ms = time_it(lambda: legacy_pipeline(frame, path), repeat)
+            rows.append({"resolution": name, "format": "legacy-png", "ms_per_frame": ms, "bytes": os.path.getsize(path)})
+            for fmt in formats:
+                encoder = FrameEncoder(fmt=fmt)
+                path = os.path.join(tmp_dir, f"frame{encoder.extension}")
+                ms = time_it(lambda: encoder.save(frame, path), repeat)
+                rows.append({"resolution": name, "format": fmt, "ms_per_frame": ms, "bytes": os.path.getsize(path)})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="截图 缩放+编码+写盘 管线的每帧耗时测试")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--formats", nargs="+", default=["jpg", "webp", "png"])
+    parser.add_argument("--repeat", type=int, default=5, help="每个组合重复次数（取中位数）")
+    parser.add_argument("--json", help="把结果写入该JSON文件")
+    args = parser.parse_args()
+
+    rows = run(args.resolutions, args.formats, args.repeat)
+    print(f"{'分辨率':<10}{'格式':<12}{'ms/帧':>10}{'大小(KB)':>12}")
+    for row in rows:
+        print(f"{row['resolution']:<10}{row['format']:<12}{row['ms_per_frame']:>10.1f}{row['bytes'] / 1024:>12.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
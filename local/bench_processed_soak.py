@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+from detector import ProcessedFiles, LatestFrameScheduler, PROCESSED_FILES_CAP
+
+
+def current_rss_kb() -> int:
+    """
+    获取当前进程的常驻内存（KB）
+
+    Linux 读取 /proc/self/statm 的实时值；其他平台退回 getrusage 的峰值
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 的 ru_maxrss 单位是字节
+        return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def soak(events: int, displays: int, cap: int, baseline: bool, samples: int = 10) -> dict:
+    """
+    用合成的文件事件驱动 已处理记录 + 调度器，按固定间隔采样RSS
+
+    Args:
+        events: 合成的文件事件数量
+        displays: 显示器数量
+        cap: ProcessedFiles 容量
+        baseline: 为True时使用普通dict（改动前的行为）作对比
+        samples: 采样次数
+
+    Returns:
+        dict: 采样结果
+    """
+    processed = dict() if baseline else ProcessedFiles(cap)
+    scheduler = LatestFrameScheduler()
+    interval = max(1, events // samples)
+    rows = []
+    start_rss = current_rss_kb()
+    started = time.perf_counter()
+    for i in range(events):
+        display = f"d{i % displays + 1}"
+        path = f"./cache/screenshot/screenshot_{display}_{i:012d}.png"
+        scheduler.put(display, path)
+        task = scheduler.get()
+        if task is not None:
+            _, _, file_path = task
+            if processed.get(file_path) != i:
+                processed[file_path] = i
+        if (i + 1) % interval == 0:
+            rows.append({"events": i + 1, "rss_kb": current_rss_kb(), "entries": len(processed)})
+            print(f"{i + 1:>12,} 事件  RSS {rows[-1]['rss_kb']:>8,} KB  记录数 {rows[-1]['entries']:>10,}")
+    elapsed = time.perf_counter() - started
+    # 跳过第一个采样点（包含分配器预热），之后的增长即为泄漏
+    steady = rows[1:] if len(rows) > 1 else rows
+    return {
+        "mode": "dict" if baseline else "ProcessedFiles",
+        "events": events,
+        "cap": None if baseline else cap,
+        "start_rss_kb": start_rss,
+        "end_rss_kb": rows[-1]["rss_kb"] if rows else start_rss,
+        "steady_growth_kb": (steady[-1]["rss_kb"] - steady[0]["rss_kb"]) if steady else 0,
+        "events_per_sec": events / elapsed if elapsed else 0.0,
+        "samples": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="detector 已处理文件记录的长时间运行内存测试")
+    parser.add_argument("--events", type=int, default=3_000_000, help="合成的文件事件数量")
+    parser.add_argument("--displays", type=int, default=2, help="显示器数量")
+    parser.add_argument("--cap", type=int, default=PROCESSED_FILES_CAP, help="ProcessedFiles 容量")
+    parser.add_argument("--baseline", action="store_true", help="使用普通dict作对比（会持续增长）")
+    parser.add_argument("--json", help="把结果写入该JSON文件")
+    args = parser.parse_args()
+
+    result = soak(args.events, args.displays, args.cap, args.baseline)
+    print(f"\n模式: {result['mode']}, 事件数: {result['events']:,}, 速度: {result['events_per_sec']:,.0f} 事件/秒")
+    print(f"RSS: {result['start_rss_kb']:,} KB -> {result['end_rss_kb']:,} KB, 稳态增长 {result['steady_growth_kb']:,} KB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
@@ -5,16 +5,20 @@ import os
 import time
 import base64
 import json
-import glob
+import hashlib
 import uuid
 from datetime import datetime
 from generate_audio import t2a_minimax
 
 from local_tracer import get_tracer
+from status_store import get_status_store
 
 tracer = get_tracer("./cache/logs")
+status_store = get_status_store("./cache")
 
 HOST_URL = "https://helped-monthly-alpaca.ngrok-free.app"
+# 与 detector.py 一致：只有这些扩展名的文件是写入完成的图片
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
 
 class HtmlView(BaseModel):
     height: int
@@ -74,21 +78,39 @@ def call_openai_api(messages, thread_id=None, response_format=HtmlView, model="g
             danmu_text="网络连接超时"
         ), e
 
-def update_status_json(fields: dict):
-    status_path = "cache/status.json"
-    if os.path.exists(status_path):
+def list_images(image_dir: str) -> list:
+    """
+    列出目录中已写入完成的图片，按修改时间从新到旧排序
+
+    截图/摄像头进程先写 <name>.tmp 再重命名，只接受图片扩展名即可跳过写了一半的文件；
+    列目录与读取mtime之间被删除的文件直接忽略
+
+    Args:
+        image_dir: 图片目录
+
+    Returns:
+        list: 图片路径列表
+    """
+    images = []
+    try:
+        entries = list(os.scandir(image_dir))
+    except FileNotFoundError:
+        return images
+    for entry in entries:
+        if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
         try:
-            with open(status_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"读取status.json失败: {e}")
-            data = {}
-    else:
-        data = {}
-    data.update(fields)
-    print("update_status_json:", data)
-    with open(status_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+            if entry.is_file():
+                images.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            continue
+    images.sort(reverse=True)
+    return [path for _, path in images]
+
+def update_status_json(fields: dict):
+    # 通过StatusStore写入，每次更新都会生成新版本并记录到事件历史
+    version = status_store.update(fields)
+    print(f"update_status_json (version {version}):", fields)
 
 def reset_status():
     data = {
@@ -684,9 +706,7 @@ def periodic_ai_task():
             print("缺少finished prompt，跳过判断步骤")
 
         # 步骤2: 如果有图片，则获取图片数量并且解析
-        image_files = glob.glob(os.path.join(IMAGE_DIR, "*"))
-        image_files = [f for f in image_files if os.path.isfile(f)]
-        image_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+        image_files = list_images(IMAGE_DIR)
         latest_images = image_files[:SCREENSHOT_UPLOAD_AMOUNT]
 
         image_messages = []
@@ -794,9 +814,13 @@ def periodic_ai_task():
             # )
             if hasattr(result, "danmu_text") and result.danmu_text != "":
                 audio = t2a_minimax(result.danmu_text)
-                with open(f"cache/voice/{current_timestamp}.mp3", "wb") as f:
-                    f.write(audio)
-                route = f"/voice/{current_timestamp}.mp3"
+                # 以内容摘要命名，server.py 会对内容寻址的文件返回长期缓存头
+                audio_name = hashlib.sha256(audio).hexdigest()[:32]
+                audio_path = f"cache/voice/{audio_name}.mp3"
+                if not os.path.exists(audio_path):
+                    with open(audio_path, "wb") as f:
+                        f.write(audio)
+                route = f"/voice/{audio_name}.mp3"
                 print("minimax结果:", route)
             else:
                 route = ""
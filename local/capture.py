@@ -0,0 +1,389 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+from typing import List
+import cv2
+import numpy as np
+
+# 截图后端：screencapture（macOS命令行）、mss（进程内，支持Linux X11/Xvfb）；默认按平台选择
+CAPTURE_BACKEND = os.environ.get("CAPTURE_BACKEND", "auto")
+# 显示器列表缓存时间（秒），到期后重新枚举以发现热插拔的显示器
+DISPLAY_REFRESH_INTERVAL = float(os.environ.get("DISPLAY_REFRESH_INTERVAL", 30))
+# 帧输出配置：格式（jpg / webp / png）、质量、缩放比例
+SCREENSHOT_FORMAT = os.environ.get("SCREENSHOT_FORMAT", "jpg")
+SCREENSHOT_QUALITY = int(os.environ.get("SCREENSHOT_QUALITY", 85))
+SCREENSHOT_SCALE = float(os.environ.get("SCREENSHOT_SCALE", 0.25))
+# 摄像头来源：设备编号（例如 0），或者视频/图片文件路径（没有摄像头时用于测试）
+CAMERA_SOURCE = os.environ.get("CAMERA_SOURCE", "0")
+CAMERA_SCALE = float(os.environ.get("CAMERA_SCALE", 1.0))
+
+
+class CaptureError(Exception):
+    """截图失败"""
+
+
+class CaptureBackend:
+    """
+    截图后端接口
+
+    显示器编号从1开始；grab 返回 BGR 格式的 NumPy 数组
+    """
+
+    name = "base"
+
+    def list_displays(self) -> List[int]:
+        """
+        枚举当前连接的显示器
+
+        Returns:
+            List[int]: 显示器编号列表
+        """
+        raise NotImplementedError
+
+    def grab(self, display_index: int) -> np.ndarray:
+        """
+        截取指定显示器
+
+        Args:
+            display_index: 显示器编号（从1开始）
+
+        Returns:
+            np.ndarray: BGR图像
+        """
+        raise NotImplementedError
+
+    def release_thread(self):
+        """释放当前线程持有的资源（截图线程退出前调用）"""
+
+    def close(self):
+        """释放后端持有的资源"""
+
+
+class ScreencaptureBackend(CaptureBackend):
+    """
+    macOS screencapture 命令行后端
+
+    每帧都要启动一个子进程并经过一次PNG编解码，开销较大，但不需要额外依赖
+    """
+
+    name = "screencapture"
+
+    def list_displays(self) -> List[int]:
+        result = subprocess.run(["system_profiler", "SPDisplaysDataType"], stdout=subprocess.PIPE, text=True)
+        return list(range(1, result.stdout.count("Resolution") + 1))
+
+    def grab(self, display_index: int) -> np.ndarray:
+        fd, tmp_path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            # -x: 不播放快门声
+            # -D: 指定显示器
+            subprocess.run(["screencapture", "-x", "-D", str(display_index), tmp_path], check=True)
+            frame = cv2.imread(tmp_path, cv2.IMREAD_COLOR)
+        except subprocess.CalledProcessError as e:
+            raise CaptureError(f"screencapture 失败: {e}") from e
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        if frame is None:
+            raise CaptureError(f"无法读取 display {display_index} 的截图")
+        return frame
+
+
+class MssBackend(CaptureBackend):
+    """
+    基于 mss 的进程内截图后端
+
+    Linux 上通过 X11 的 XShm/XGetImage 直接读取帧缓冲（Xvfb 同样可用），不需要启动子进程。
+    mss 实例不能跨线程共享，每个线程持有自己的实例；重新枚举显示器后旧实例会被替换。
+    """
+
+    name = "mss"
+
+    def __init__(self):
+        import mss  # 可选依赖，只有选用该后端时才需要安装
+
+        self._mss = mss
+        self._local = threading.local()
+        self._generation = 0
+
+    def _instance(self):
+        local = self._local
+        if getattr(local, "sct", None) is None or local.generation != self._generation:
+            if getattr(local, "sct", None) is not None:
+                local.sct.close()
+            local.sct = self._mss.mss()
+            local.generation = self._generation
+        return local.sct
+
+    def list_displays(self) -> List[int]:
+        # 新建实例才能读到最新的显示器布局
+        with self._mss.mss() as sct:
+            count = len(sct.monitors) - 1  # monitors[0] 是所有显示器的合并区域
+        self._generation += 1
+        return list(range(1, count + 1))
+
+    def grab(self, display_index: int) -> np.ndarray:
+        try:
+            sct = self._instance()
+            monitors = sct.monitors
+            if display_index < 1 or display_index >= len(monitors):
+                raise CaptureError(f"display {display_index} 不存在")
+            shot = sct.grab(monitors[display_index])
+        except self._mss.ScreenShotError as e:
+            raise CaptureError(f"mss 截图失败: {e}") from e
+        # mss 返回 BGRA，去掉 alpha 通道
+        return cv2.cvtColor(np.asarray(shot), cv2.COLOR_BGRA2BGR)
+
+    def release_thread(self):
+        # 每个线程的实例持有一个 X11/Quartz 连接，只能由创建它的线程关闭
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+    def close(self):
+        self.release_thread()
+
+
+class FrameEncoder:
+    """
+    单次完成 缩放 -> 编码 -> 原子写入 的帧输出管线
+
+    在内存中用 INTER_AREA 缩小（整数倍缩小时效果接近 LANCZOS，速度快得多），
+    只编码一次；PNG 使用最低压缩级别
+    """
+
+    def __init__(self, fmt: str = SCREENSHOT_FORMAT, quality: int = SCREENSHOT_QUALITY, scale: float = SCREENSHOT_SCALE):
+        """
+        初始化编码器
+
+        Args:
+            fmt: 输出格式（jpg / webp / png）
+            quality: JPEG/WebP 质量（1-100）
+            scale: 缩放比例
+        """
+        fmt = fmt.lower().lstrip(".")
+        if fmt == "jpeg":
+            fmt = "jpg"
+        if fmt == "jpg":
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif fmt == "webp":
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        elif fmt == "png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        else:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        self.fmt = fmt
+        self.extension = f".{fmt}"
+        self.scale = scale
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        """
+        缩放并编码一帧
+
+        Args:
+            frame: BGR图像
+
+        Returns:
+            bytes: 编码后的图片数据
+        """
+        if self.scale != 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(self.extension, frame, self.params)
+        if not ok:
+            raise CaptureError(f"编码 {self.fmt} 失败")
+        return buffer.tobytes()
+
+    def save(self, frame: np.ndarray, path: str) -> int:
+        """
+        缩放、编码并原子写入文件
+
+        先写入同目录下的 .tmp 临时文件再 rename，读者（detector.py）永远不会看到写了一半的图片
+
+        Args:
+            frame: BGR图像
+            path: 目标文件路径
+
+        Returns:
+            int: 写入的字节数
+        """
+        data = self.encode(frame)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+
+class CameraStream:
+    """
+    常驻的摄像头读取流
+
+    打开一次 cv2.VideoCapture 并保持不关闭，后台线程持续读取，只保留最新的一帧；
+    取帧时直接返回这帧，不再为每张照片重新打开设备、等待自动曝光。
+    来源是文件时读到结尾会从头循环，可以在没有摄像头的环境里代替真实设备
+    """
+
+    def __init__(self, source: str = CAMERA_SOURCE, reopen_delay: float = 1.0):
+        """
+        初始化读取流（不会立即打开设备，调用 start() 后开始读取）
+
+        Args:
+            source: 设备编号或文件路径
+            reopen_delay: 设备读取失败后重新打开前的等待时间（秒）
+        """
+        self.source = int(source) if str(source).isdigit() else source
+        self.is_file = not isinstance(self.source, int)
+        self.reopen_delay = reopen_delay
+        self._capture = None
+        self._frame = None
+        self._frame_seq = 0
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _open(self) -> bool:
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            capture.release()
+            return False
+        if not self.is_file:
+            # 只缓冲一帧，避免读到驱动队列里的旧画面
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._capture = capture
+        return True
+
+    def start(self) -> "CameraStream":
+        """
+        打开设备并启动后台读取线程
+
+        Returns:
+            CameraStream: 自身，便于链式调用
+        """
+        if not self._open():
+            raise CaptureError(f"无法打开摄像头: {self.source}")
+        self._thread = threading.Thread(target=self._reader, name="camera-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def _reader(self):
+        # 文件来源按原始帧率播放，否则会瞬间读完
+        fps = self._capture.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        frame_interval = 1.0 / fps if fps and fps > 0 else (0.033 if self.is_file else 0.0)
+        while not self._stop_event.is_set():
+            ok, frame = self._capture.read()
+            if not ok:
+                if self.is_file and self._capture.get(cv2.CAP_PROP_POS_FRAMES) > 0:
+                    self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                print(f"摄像头读取失败，{self.reopen_delay}秒后重新打开: {self.source}")
+                self._capture.release()
+                if self._stop_event.wait(self.reopen_delay):
+                    break
+                self._open()
+                continue
+            with self._cond:
+                self._frame = frame
+                self._frame_seq += 1
+                self._cond.notify_all()
+            if frame_interval:
+                self._stop_event.wait(frame_interval)
+        if self._capture is not None:
+            self._capture.release()
+
+    def read(self, timeout: float = 5.0, after_seq: int = 0):
+        """
+        获取最新的一帧
+
+        Args:
+            timeout: 还没有比 after_seq 更新的帧时最多等待的时间（秒）
+            after_seq: 上次取到的帧序号，传入后只返回更新的帧
+
+        Returns:
+            tuple: (帧序号, BGR图像)
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame_seq > after_seq, timeout):
+                raise CaptureError(f"摄像头 {timeout} 秒内没有新画面: {self.source}")
+            return self._frame_seq, self._frame
+
+    def close(self):
+        """停止后台线程并释放设备"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+
+class DisplayRegistry:
+    """
+    显示器枚举缓存
+
+    枚举显示器（例如 system_profiler）很慢，结果缓存 refresh_interval 秒；
+    截图失败时调用 invalidate() 立即重新枚举，以便及时发现拔出/接入的显示器
+    """
+
+    def __init__(self, backend: CaptureBackend, refresh_interval: float = DISPLAY_REFRESH_INTERVAL):
+        """
+        初始化缓存
+
+        Args:
+            backend: 截图后端
+            refresh_interval: 缓存时间（秒）
+        """
+        self.backend = backend
+        self.refresh_interval = refresh_interval
+        self._displays = []
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def displays(self) -> List[int]:
+        """
+        获取显示器列表（必要时重新枚举）
+
+        Returns:
+            List[int]: 显示器编号列表
+        """
+        with self._lock:
+            if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                try:
+                    displays = self.backend.list_displays()
+                except Exception as e:
+                    print(f"枚举显示器失败: {e}")
+                    displays = self._displays
+                if displays != self._displays:
+                    print(f"显示器变化: {self._displays} -> {displays}")
+                self._displays = displays
+                self._refreshed_at = time.monotonic()
+            return list(self._displays)
+
+    def invalidate(self):
+        """下次调用 displays() 时强制重新枚举"""
+        with self._lock:
+            self._refreshed_at = 0.0
+
+
+def get_capture_backend(name: str = CAPTURE_BACKEND) -> CaptureBackend:
+    """
+    创建截图后端
+
+    Args:
+        name: 后端名称（screencapture / mss / auto）
+
+    Returns:
+        CaptureBackend: 截图后端实例
+    """
+    if name == "auto":
+        name = "screencapture" if sys.platform == "darwin" else "mss"
+    if name == "screencapture":
+        return ScreencaptureBackend()
+    if name == "mss":
+        return MssBackend()
+    raise ValueError(f"未知的截图后端: {name}")
@@ -0,0 +1,170 @@
+import os
+import re
+import threading
+from typing import Optional
+import cv2
+import numpy as np
+
+# 缩略签名尺寸（宽, 高），每个格子是原图一小块区域的平均灰度
+SIGNATURE_SIZE = (64, 36)
+# 单个格子灰度变化超过该值才算“变化”
+CELL_DIFF_LEVEL = 8
+# 变化格子占比低于该值时认为画面没有变化
+FRAME_DIFF_MIN_CHANGE = float(os.environ.get("FRAME_DIFF_MIN_CHANGE", 0.002))
+
+DISPLAY_KEY_RE = re.compile(r"^screenshot_(d\d+)_")
+
+
+def frame_signature(image: np.ndarray) -> np.ndarray:
+    """
+    计算图像的缩略签名
+
+    Args:
+        image: BGR或灰度图像
+
+    Returns:
+        np.ndarray: SIGNATURE_SIZE 大小的灰度 int16 数组
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def read_signature(image_path: str) -> Optional[np.ndarray]:
+    """
+    读取图片文件并计算签名
+
+    使用 IMREAD_REDUCED_GRAYSCALE_4 在解码时直接缩小，比完整解码便宜得多
+
+    Args:
+        image_path: 图片文件路径
+
+    Returns:
+        np.ndarray: 签名；无法读取时返回None
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    return frame_signature(image)
+
+
+def change_score(previous: np.ndarray, current: np.ndarray) -> float:
+    """
+    计算两个签名之间的变化程度
+
+    按格子比较而不是整体平均，这样画面一角新出现的小二维码也不会被大面积静止区域稀释
+
+    Args:
+        previous: 上一帧签名
+        current: 当前帧签名
+
+    Returns:
+        float: 变化格子占比（0~1）
+    """
+    if previous.shape != current.shape:
+        return 1.0
+    return float(np.count_nonzero(np.abs(current - previous) > CELL_DIFF_LEVEL)) / current.size
+
+
+def display_key(image_path: str) -> str:
+    """
+    根据文件名确定图片来自哪个显示器/摄像头
+
+    Args:
+        image_path: 图片文件路径
+
+    Returns:
+        str: 例如 "d1"、"d2"、"camera"
+    """
+    name = os.path.basename(image_path)
+    match = DISPLAY_KEY_RE.match(name)
+    if match:
+        return match.group(1)
+    return name.split("_", 1)[0]
+
+
+class FrameGate:
+    """
+    帧差门控
+
+    为每个显示器保存上一帧的缩略签名，画面变化低于阈值时跳过二维码分析，
+    并统计跳过率与节省的CPU时间
+    """
+
+    def __init__(self, min_change: float = FRAME_DIFF_MIN_CHANGE):
+        """
+        初始化门控
+
+        Args:
+            min_change: 变化格子占比阈值
+        """
+        self.min_change = min_change
+        self._signatures = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.gate_cpu = 0.0
+        # 单次分析CPU耗时的指数滑动平均，用来估算跳过节省的时间
+        self.analysis_cpu_avg = 0.0
+
+    def should_process(self, key: str, signature: np.ndarray, gate_cpu: float = 0.0) -> bool:
+        """
+        判断当前帧是否需要分析，并更新该显示器的签名
+
+        Args:
+            key: 显示器标识
+            signature: 当前帧签名
+            gate_cpu: 计算签名花费的CPU时间（秒）
+
+        Returns:
+            bool: True 表示画面有变化，需要分析
+        """
+        with self._lock:
+            self.checked += 1
+            self.gate_cpu += gate_cpu
+            previous = self._signatures.get(key)
+            if previous is not None and change_score(previous, signature) < self.min_change:
+                self.skipped += 1
+                return False
+            self._signatures[key] = signature
+            return True
+
+    def record_analysis(self, cpu_seconds: float):
+        """
+        记录一次完整分析的CPU耗时
+
+        Args:
+            cpu_seconds: 分析耗时（秒）
+        """
+        with self._lock:
+            if self.analysis_cpu_avg == 0.0:
+                self.analysis_cpu_avg = cpu_seconds
+            else:
+                self.analysis_cpu_avg = 0.9 * self.analysis_cpu_avg + 0.1 * cpu_seconds
+
+    def stats(self) -> dict:
+        """
+        获取门控统计
+
+        Returns:
+            dict: checked, skipped, skip_rate, cpu_saved_s（已扣除签名计算开销）
+        """
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+                "cpu_saved_s": self.skipped * self.analysis_cpu_avg - self.gate_cpu,
+            }
+
+    def report(self) -> str:
+        """
+        生成一行可读的统计摘要
+
+        Returns:
+            str: 统计摘要
+        """
+        stats = self.stats()
+        return (
+            f"帧差门控: 检查{stats['checked']}帧, 跳过{stats['skipped']}帧 "
+            f"({stats['skip_rate']:.0%}), 估计节省CPU {stats['cpu_saved_s']:.2f}秒"
+        )
@@ -11,6 +11,7 @@ SCRIPT_COLORS = {
     "screenshot.py": "\033[93m", # 黄色 - 屏幕截图模块
     "transcribe.py": "\033[95m", # 紫色 - 音频转写模块
     "detector.py": "\033[94m",   # 蓝色
+    "server.py": "\033[97m",     # 白色 - cache静态资源服务
 }
 RESET_COLOR = "\033[0m"  # 重置颜色
 
@@ -47,7 +48,8 @@ if __name__ == "__main__":
         "listener.py",     # 音频录制模块
         "screenshot.py",   # 屏幕截图模块
         "transcribe.py",   # 音频转写模块
-        "detector.py"
+        "detector.py",
+        "server.py"        # cache静态资源服务
     ]
     
     processes = []  # 存储所有子进程
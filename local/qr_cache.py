@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# 同一个二维码持续出现时，距上次看到不足该秒数则不再重复发布
+QR_COOLDOWN = float(os.environ.get("QR_COOLDOWN", 120))
+# 网页摘要的有效期（秒），跨进程重启复用
+QR_SUMMARY_TTL = float(os.environ.get("QR_SUMMARY_TTL", 7 * 24 * 3600))
+QR_CACHE_SIZE = int(os.environ.get("QR_CACHE_SIZE", 256))
+
+
+class QRResultCache:
+    """
+    以二维码内容为键的结果缓存
+
+    - 冷却：同一内容在 cooldown 秒内再次出现（按最后一次看到的时间滑动计算）时不再发布，
+      避免反复抓取网页、调用GPT总结、重写status.json和重播客户端动画
+    - 摘要：网页摘要按 TTL 缓存并持久化到磁盘，重启后仍可复用
+    - 容量：按最近使用淘汰（LRU），最多保留 max_entries 条
+    """
+
+    def __init__(self, path: str, cooldown: float = QR_COOLDOWN, summary_ttl: float = QR_SUMMARY_TTL, max_entries: int = QR_CACHE_SIZE):
+        """
+        初始化缓存
+
+        Args:
+            path: 摘要持久化文件路径
+            cooldown: 冷却时间（秒）
+            summary_ttl: 摘要有效期（秒）
+            max_entries: 最多缓存的二维码数量
+        """
+        self.path = path
+        self.cooldown = cooldown
+        self.summary_ttl = summary_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # payload -> {"last_seen", "summary", "summarized_at"}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.suppressed = 0
+        self.summary_hits = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except Exception as e:
+            print(f"读取二维码缓存失败: {e}")
+            return
+        now = time.time()
+        for payload, item in saved.items():
+            if now - item.get("summarized_at", 0) < self.summary_ttl:
+                self._entries[payload] = {
+                    "last_seen": 0.0,
+                    "summary": item.get("summary"),
+                    "summarized_at": item.get("summarized_at", 0),
+                }
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        """只持久化摘要（冷却状态只在本次运行中有效）"""
+        saved = {
+            payload: {"summary": item["summary"], "summarized_at": item["summarized_at"]}
+            for payload, item in self._entries.items()
+            if item["summary"] is not None
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, payload: str) -> dict:
+        item = self._entries.get(payload)
+        if item is None:
+            item = {"last_seen": 0.0, "summary": None, "summarized_at": 0}
+            self._entries[payload] = item
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(payload)
+        return item
+
+    def should_publish(self, payload: str) -> bool:
+        """
+        记录一次看到该二维码，并判断是否需要发布
+
+        Args:
+            payload: 二维码内容
+
+        Returns:
+            bool: 冷却期外首次看到时返回True
+        """
+        now = time.time()
+        with self._lock:
+            item = self._entry(payload)
+            last_seen = item["last_seen"]
+            item["last_seen"] = now
+            if now - last_seen < self.cooldown:
+                self.suppressed += 1
+                return False
+            self.published += 1
+            return True
+
+    def get_summary(self, payload: str) -> Optional[str]:
+        """
+        获取未过期的网页摘要
+
+        Args:
+            payload: 二维码内容
+
+        Returns:
+            str: 摘要；没有或已过期时返回None
+        """
+        with self._lock:
+            item = self._entries.get(payload)
+            if item is None or item["summary"] is None:
+                return None
+            if time.time() - item["summarized_at"] >= self.summary_ttl:
+                item["summary"] = None
+                return None
+            self._entries.move_to_end(payload)
+            self.summary_hits += 1
+            return item["summary"]
+
+    def put_summary(self, payload: str, summary: str):
+        """
+        保存网页摘要并持久化
+
+        Args:
+            payload: 二维码内容
+            summary: 摘要文本
+        """
+        with self._lock:
+            item = self._entry(payload)
+            item["summary"] = summary
+            item["summarized_at"] = time.time()
+            try:
+                self._save()
+            except Exception as e:
+                print(f"保存二维码缓存失败: {e}")
+
+    def report(self) -> str:
+        """
+        生成一行可读的统计摘要
+
+        Returns:
+            str: 统计摘要
+        """
+        with self._lock:
+            return f"二维码缓存: 发布{self.published}次, 冷却跳过{self.suppressed}次, 摘要命中{self.summary_hits}次"
+
+
+# 全局实例
+_qr_cache_instance = None
+_qr_cache_lock = threading.Lock()
+
+def get_qr_cache(path: str = "./cache/qr_cache.json"):
+    """
+    获取全局二维码结果缓存实例
+
+    Args:
+        path: 摘要持久化文件路径
+
+    Returns:
+        QRResultCache: 缓存实例
+    """
+    global _qr_cache_instance
+    with _qr_cache_lock:
+        if _qr_cache_instance is None:
+            _qr_cache_instance = QRResultCache(path)
+        return _qr_cache_instance
@@ -1,7 +1,51 @@
 import os
 import time
 import datetime
-import subprocess
+import itertools
+import threading
+from collections import deque
+import cv2
+from capture import (CAMERA_SCALE, CameraStream, CaptureBackend, CaptureError, DisplayRegistry, FrameEncoder,
+                     get_capture_backend)
+from frame_gate import FRAME_DIFF_MIN_CHANGE, change_score, frame_signature
+
+# 自适应截图频率：画面不变时间隔按指数退避到 SCREENSHOT_MAX_INTERVAL，画面变化时立即回到 SCREENSHOT_MIN_INTERVAL
+ADAPTIVE_CAPTURE = int(os.environ.get("ADAPTIVE_CAPTURE", 1))
+# 最短间隔默认等于 interval_sec：画面变化时回到原来的频率，而不是比关闭自适应时截得更快
+SCREENSHOT_MIN_INTERVAL = float(os.environ["SCREENSHOT_MIN_INTERVAL"]) if os.environ.get("SCREENSHOT_MIN_INTERVAL") else None
+SCREENSHOT_MAX_INTERVAL = float(os.environ.get("SCREENSHOT_MAX_INTERVAL", 8))
+# 计算画面签名前的降采样步长（直接切片，不拷贝）
+SIGNATURE_STRIDE = 8
+# 停止截图线程时最多等待其退出的时间（秒）
+WORKER_JOIN_TIMEOUT = 5.0
+
+# 全局截图后端与显示器缓存（按需创建）
+_backend = None
+_registry = None
+
+def get_backend() -> CaptureBackend:
+    """
+    获取全局截图后端
+
+    Returns:
+        CaptureBackend: 由 CAPTURE_BACKEND 环境变量选择的后端
+    """
+    global _backend, _registry
+    if _backend is None:
+        _backend = get_capture_backend()
+        _registry = DisplayRegistry(_backend)
+        print(f"截图后端: {_backend.name}")
+    return _backend
+
+def get_display_registry() -> DisplayRegistry:
+    """
+    获取全局显示器枚举缓存
+
+    Returns:
+        DisplayRegistry: 显示器缓存
+    """
+    get_backend()
+    return _registry
 
 def screenshot_display(display_index: int, filename: str):
     """
@@ -12,80 +56,342 @@ def screenshot_display(display_index: int, filename: str):
         filename (str): 保存的文件路径
     """
     try:
-        # 使用macOS的screencapture命令截图
-        # -x: 不播放快门声
-        # -D: 指定显示器
-        subprocess.run(["screencapture", "-x", "-D", str(display_index), filename], check=True)
+        frame = get_backend().grab(display_index)
+        cv2.imwrite(filename, frame)
         print(f"Display {display_index} 截图保存至: {os.path.abspath(filename)}")
-    except subprocess.CalledProcessError as e:
+    except CaptureError as e:
         print(f"截图失败: {e}")
 
 def get_display_count():
     """
-    获取系统中显示器的数量
+    获取系统中显示器的数量（结果会缓存，定期重新枚举以发现热插拔）
     
     Returns:
         int: 显示器数量（包括镜像显示器）
     """
-    result = subprocess.run(["system_profiler", "SPDisplaysDataType"], stdout=subprocess.PIPE, text=True)
-    return result.stdout.count("Resolution")
+    return len(get_display_registry().displays())
 
-def continuous_screenshot(duration_sec=10, interval_sec=1):
+class FrameClock:
     """
-    连续截取所有显示器的屏幕
-    
-    Args:
-        duration_sec (int): 截图持续时间（秒），目前未使用
-        interval_sec (int): 截图间隔时间（秒）
+    所有截图线程共享的时钟
+
+    第k个节拍固定在 start + k * interval，线程按节拍对齐截图；
+    某一帧耗时超过间隔时直接跳到下一个未来的节拍，而不是把后续截图整体往后推
     """
-    from PIL import Image
 
-    # 创建截图输出目录
-    output_dir = os.path.abspath(os.path.join(".", "cache", "screenshot"))
-    os.makedirs(output_dir, exist_ok=True)
+    def __init__(self, interval_sec: float):
+        """
+        初始化时钟
 
-    display_count = get_display_count()
-    print(f"检测到 {display_count} 个显示器（包括镜像）")
+        Args:
+            interval_sec: 节拍间隔（秒）
+        """
+        self.interval = interval_sec
+        self.start = time.monotonic()
 
-    while True:
-        # 生成时间戳用于文件名
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        
-        # 为每个显示器截图
-        for display_index in range(1, display_count + 1):
-            filename = f"screenshot_d{display_index}_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-            screenshot_display(display_index, filepath)
+    def wait_for_tick(self, tick: int, stop_event: threading.Event) -> int:
+        """
+        等待到指定节拍；该节拍已经错过时返回下一个未来的节拍
 
-            # 缩小图片尺寸为原来的1/4以节省存储空间
-            try:
-                with Image.open(filepath) as img:
-                    new_size = (img.width // 4, img.height // 4)
-                    img_resized = img.resize(new_size, Image.LANCZOS)
-                    img_resized.save(filepath, optimize=True)
-                    print(f"已缩放并保存: {filepath} ({new_size[0]}x{new_size[1]})")
-            except Exception as e:
-                print(f"缩放图片失败: {filepath}, 错误: {e}")
+        Args:
+            tick: 期望的节拍序号
+            stop_event: 停止信号，等待期间被设置时立即返回
+
+        Returns:
+            int: 实际到达的节拍序号
+        """
+        now = time.monotonic()
+        current = int((now - self.start) / self.interval)
+        if tick <= current and now - (self.start + tick * self.interval) > self.interval / 2:
+            tick = current + 1
+        stop_event.wait(max(0.0, self.start + tick * self.interval - now))
+        return tick
+
+
+class AdaptiveRate:
+    """
+    单个显示器的自适应截图频率
+
+    共享时钟按最快频率走节拍，stride 表示每隔几个节拍截一次图：
+    连续出现无变化的帧时 stride 翻倍（不超过最慢频率），画面一变化立即回到1
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, start_interval: float = None):
+        """
+        初始化频率控制
+
+        Args:
+            min_interval: 最短截图间隔（秒），即最高频率，也是共享时钟的节拍间隔
+            max_interval: 最长截图间隔（秒），即最低频率
+            start_interval: 初始截图间隔（秒），默认为最短间隔
+        """
+        self.min_interval = min_interval
+        self.max_stride = max(1, int(round(max_interval / min_interval)))
+        start = start_interval if start_interval is not None else min_interval
+        self.stride = min(self.max_stride, max(1, int(round(start / min_interval))))
+        self.captures = 0
+        self.unchanged = 0
+        self.saved = 0  # 退避期间跳过的截图次数
+
+    def observe(self, changed: bool) -> int:
+        """
+        记录一次截图结果并计算下一次截图前要等待的节拍数
+
+        Args:
+            changed: 画面相对上一次写盘的帧是否有变化
+
+        Returns:
+            int: 下一次截图前的节拍数
+        """
+        self.captures += 1
+        if changed:
+            self.stride = 1
+        else:
+            self.unchanged += 1
+            self.stride = min(self.stride * 2, self.max_stride)
+        self.saved += self.stride - 1
+        return self.stride
+
+    @property
+    def interval(self) -> float:
+        """当前截图间隔（秒）"""
+        return self.stride * self.min_interval
 
-        time.sleep(interval_sec)
 
-def camera_capture(filename: str):
+class DisplayCaptureWorker(threading.Thread):
     """
-    使用摄像头拍照
+    单个显示器的截图线程
+
+    帧文件名包含毫秒时间戳和单调递增的序号，同一秒内的多帧不会相互覆盖；
+    同时统计实际达到的帧率与错过的节拍数。
+    设置了 rate 时按画面变化调整截图频率，并且不再写出与上一帧相同的画面
+    """
+
+    FPS_WINDOW_SEC = 10.0
+
+    def __init__(self, display_index: int, backend: CaptureBackend, registry: DisplayRegistry,
+                 encoder: FrameEncoder, clock: FrameClock, output_dir: str, rate: AdaptiveRate = None):
+        super().__init__(name=f"capture-d{display_index}", daemon=True)
+        self.display_index = display_index
+        self.backend = backend
+        self.registry = registry
+        self.encoder = encoder
+        self.clock = clock
+        self.output_dir = output_dir
+        self.rate = rate
+        self.stop_event = threading.Event()
+        self.seq = itertools.count()
+        self.frames = 0
+        self.missed_ticks = 0
+        self.errors = 0
+        self.skipped_writes = 0
+        self._signature = None  # 上一次写盘的帧的签名
+        self._recent = deque()  # 最近 FPS_WINDOW_SEC 秒内每帧完成的时间
+        self._lock = threading.Lock()
+
+    def frame_id(self) -> str:
+        """
+        生成帧文件名（不含扩展名）
+
+        Returns:
+            str: 例如 screenshot_d1_2025-07-26_12-30-30-123_000042
+        """
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y-%m-%d_%H-%M-%S") + f"-{now.microsecond // 1000:03d}"
+        return f"screenshot_d{self.display_index}_{timestamp}_{next(self.seq):06d}"
+
+    def run(self):
+        tick = 0
+        try:
+            while not self.stop_event.is_set():
+                reached = self.clock.wait_for_tick(tick, self.stop_event)
+                if self.stop_event.is_set():
+                    return
+                with self._lock:
+                    self.missed_ticks += reached - tick
+                changed = self.capture_once()
+                with self._lock:
+                    stride = 1 if self.rate is None else self.rate.observe(changed)
+                    tick = reached + stride
+                    self._record_capture(time.monotonic(), stride * self.clock.interval)
+        finally:
+            # 关闭本线程的截图实例，显示器拔出或退出时不泄漏连接
+            self.backend.release_thread()
+
+    def _record_capture(self, now: float, interval: float):
+        """记录一次截图完成的时间及其后计划的截图间隔（调用方持有锁）"""
+        self._recent.append((now, interval))
+        while self._recent and now - self._recent[0][0] > self.FPS_WINDOW_SEC:
+            self._recent.popleft()
+
+    def capture_once(self) -> bool:
+        """
+        截取一帧并写盘
+
+        Returns:
+            bool: 画面是否有变化（截图失败时按有变化处理，保持最高频率重试）
+        """
+        try:
+            frame = self.backend.grab(self.display_index)
+        except CaptureError as e:
+            print(f"截图失败: {e}")
+            with self._lock:
+                self.errors += 1
+            self.registry.invalidate()
+            return True
+        if self.rate is not None:
+            # 在降采样后的小图上比较，成本远低于编码一帧
+            signature = frame_signature(frame[::SIGNATURE_STRIDE, ::SIGNATURE_STRIDE])
+            if self._signature is not None and change_score(self._signature, signature) < FRAME_DIFF_MIN_CHANGE:
+                with self._lock:
+                    self.skipped_writes += 1
+                return False
+            self._signature = signature
+        filepath = os.path.join(self.output_dir, self.frame_id() + self.encoder.extension)
+        # 在内存中缩小并只编码一次，原子写入
+        try:
+            self.encoder.save(frame, filepath)
+        except Exception as e:
+            print(f"保存截图失败: {filepath}, 错误: {e}")
+            with self._lock:
+                self.errors += 1
+            return True
+        with self._lock:
+            self.frames += 1
+        return True
+
+    def achieved_fps(self) -> float:
+        """
+        最近一个统计窗口内实际达到的截图频率（包括画面未变化、没有写盘的截图）
+
+        Returns:
+            float: 帧/秒
+        """
+        with self._lock:
+            if len(self._recent) < 2:
+                return 0.0
+            span = self._recent[-1][0] - self._recent[0][0]
+            return (len(self._recent) - 1) / span if span > 0 else 0.0
+
+    def target_fps(self) -> float:
+        """
+        同一窗口内按计划应达到的截图频率；自适应模式下间隔不断变化，按窗口内计划的间隔计算
+
+        Returns:
+            float: 帧/秒
+        """
+        with self._lock:
+            planned = sum(interval for _, interval in list(self._recent)[:-1])
+            if planned > 0:
+                return (len(self._recent) - 1) / planned
+            interval = self.rate.interval if self.rate is not None else self.clock.interval
+            return 1.0 / interval
+
+    def stats(self) -> dict:
+        """
+        获取该显示器的截图统计
+
+        Returns:
+            dict: display, frames, fps（截图频率）, target_fps, missed_ticks, errors, skipped_writes,
+                  以及自适应模式下的 interval, captures_saved
+        """
+        fps = self.achieved_fps()
+        target_fps = self.target_fps()
+        with self._lock:
+            interval = self.rate.interval if self.rate is not None else self.clock.interval
+            return {
+                "display": self.display_index,
+                "frames": self.frames,
+                "fps": fps,
+                "target_fps": target_fps,
+                "missed_ticks": self.missed_ticks,
+                "errors": self.errors,
+                "skipped_writes": self.skipped_writes,
+                "interval": interval,
+                "captures_saved": self.rate.saved if self.rate is not None else 0,
+            }
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def continuous_screenshot(duration_sec=10, interval_sec=1, report_sec=30, adaptive=ADAPTIVE_CAPTURE,
+                          min_interval=SCREENSHOT_MIN_INTERVAL, max_interval=SCREENSHOT_MAX_INTERVAL):
+    """
+    连续截取所有显示器的屏幕
+
+    每个显示器一个截图线程，按共享时钟并行截图；主线程负责跟随显示器热插拔增减线程，
+    并定期打印每个显示器实际达到的帧率
     
     Args:
-        filename (str): 保存的文件路径
+        duration_sec (int): 截图持续时间（秒），目前未使用
+        interval_sec (int): 截图间隔时间（秒）；自适应模式下作为初始间隔
+        report_sec (int): 帧率统计打印间隔（秒）
+        adaptive (int): 是否按画面变化自适应调整截图频率
+        min_interval (float): 自适应模式下的最短截图间隔（秒），默认等于 interval_sec
+        max_interval (float): 自适应模式下的最长截图间隔（秒）
     """
+    # 创建截图输出目录
+    output_dir = os.path.abspath(os.path.join(".", "cache", "screenshot"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    backend = get_backend()
+    registry = get_display_registry()
+    encoder = FrameEncoder()
+    if adaptive:
+        min_interval = interval_sec if min_interval is None else min(min_interval, interval_sec)
+        max_interval = max(max_interval, interval_sec)
+        clock = FrameClock(min_interval)
+    else:
+        clock = FrameClock(interval_sec)
+    print(f"检测到 {get_display_count()} 个显示器（包括镜像）")
+    print(f"输出格式: {encoder.fmt}, 缩放比例: {encoder.scale}")
+    if adaptive:
+        print(f"自适应截图间隔: {min_interval}s ~ {max_interval}s")
+
+    workers = {}
+    last_report = time.monotonic()
     try:
-        # 使用imagesnap命令拍照（需要安装：brew install imagesnap）
-        subprocess.run(["imagesnap", filename], check=True)
-        print(f"摄像头拍照保存至: {os.path.abspath(filename)}")
-    except subprocess.CalledProcessError as e:
-        print(f"摄像头拍照失败: {e}")
+        while True:
+            # 显示器列表有缓存，过期或截图失败时重新枚举
+            displays = set(registry.displays())
+            for display_index in displays - set(workers):
+                rate = AdaptiveRate(min_interval, max_interval, interval_sec) if adaptive else None
+                worker = DisplayCaptureWorker(display_index, backend, registry, encoder, clock, output_dir, rate)
+                worker.start()
+                workers[display_index] = worker
+                print(f"Display {display_index} 开始截图")
+            for display_index in set(workers) - displays:
+                worker = workers.pop(display_index)
+                worker.stop()
+                worker.join(WORKER_JOIN_TIMEOUT)
+                print(f"Display {display_index} 已断开，停止截图")
+
+            if time.monotonic() - last_report >= report_sec:
+                last_report = time.monotonic()
+                for worker in workers.values():
+                    item = worker.stats()
+                    warning = " ⚠️ 未达到目标帧率" if item["fps"] < item["target_fps"] * 0.9 else ""
+                    adaptive_info = ""
+                    if adaptive:
+                        adaptive_info = (f", 当前间隔 {item['interval']:.1f}s, 画面未变化跳过写盘{item['skipped_writes']}次, "
+                                         f"退避节省截图{item['captures_saved']}次")
+                    print(f"Display {item['display']}: {item['fps']:.2f}/{item['target_fps']:.2f} fps, "
+                          f"共{item['frames']}帧{adaptive_info}, 错过节拍{item['missed_ticks']}次, "
+                          f"失败{item['errors']}次{warning}")
+            time.sleep(1)
+    finally:
+        for worker in workers.values():
+            worker.stop()
+        for worker in workers.values():
+            worker.join(WORKER_JOIN_TIMEOUT)
 
 def continuous_camera_capture(duration_sec=10, interval_sec=1):
     """
     连续使用摄像头拍照
+
+    摄像头保持常开，后台线程持续读取最新画面，每个间隔取一帧，
+    经过与截图相同的 缩放 -> 编码 -> 原子写入 管线输出
     
     Args:
         duration_sec (int): 拍照持续时间（秒），目前未使用
@@ -95,13 +401,32 @@ def continuous_camera_capture(duration_sec=10, interval_sec=1):
     output_dir = os.path.abspath(os.path.join(".", "cache", "camera"))
     os.makedirs(output_dir, exist_ok=True)
 
-    while True:
-        # 生成时间戳用于文件名
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"camera_{timestamp}.jpg"
-        filepath = os.path.join(output_dir, filename)
-        camera_capture(filepath)
-        time.sleep(interval_sec)
+    encoder = FrameEncoder(scale=CAMERA_SCALE)
+    clock = FrameClock(interval_sec)
+    stop_event = threading.Event()
+    seq = itertools.count()
+    stream = CameraStream().start()
+    print(f"摄像头已打开: {stream.source}")
+    frame_seq = 0
+    tick = 0
+    try:
+        while True:
+            tick = clock.wait_for_tick(tick, stop_event) + 1
+            try:
+                # 画面没有更新（例如摄像头卡住）时不重复写出同一帧
+                frame_seq, frame = stream.read(timeout=max(interval_sec, 1.0), after_seq=frame_seq)
+            except CaptureError as e:
+                print(f"摄像头拍照失败: {e}")
+                continue
+            now = datetime.datetime.now()
+            timestamp = now.strftime("%Y-%m-%d_%H-%M-%S") + f"-{now.microsecond // 1000:03d}"
+            filepath = os.path.join(output_dir, f"camera_{timestamp}_{next(seq):06d}{encoder.extension}")
+            try:
+                encoder.save(frame, filepath)
+            except Exception as e:
+                print(f"保存照片失败: {filepath}, 错误: {e}")
+    finally:
+        stream.close()
 
 if __name__ == "__main__":
     # 从环境变量读取配置参数
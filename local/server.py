@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from status_store import get_status_store
+
+CACHE_DIR = os.path.join(".", "cache")
+
+# 允许对外提供的静态资源子目录
+ASSET_DIRS = ("voice", "html")
+
+# 文件名主体为十六进制摘要的文件视为内容寻址，内容永不变化，可长期缓存
+CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{16,64}$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+status_store = get_status_store(CACHE_DIR)
+
+
+class ETagCache:
+    """
+    强ETag缓存
+
+    以 (路径, 大小, mtime_ns) 为键缓存文件内容的sha256，文件不变时无需重新计算
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, st: os.stat_result) -> str:
+        """
+        获取文件的强ETag
+
+        Args:
+            path: 文件路径
+            st: 文件的stat结果
+
+        Returns:
+            str: 带引号的ETag
+        """
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            etag = self._entries.get(key)
+            if etag is not None:
+                self._entries.move_to_end(key)
+                return etag
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+        with self._lock:
+            self._entries[key] = etag
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+
+etag_cache = ETagCache()
+
+
+def parse_range(header: str, file_size: int):
+    """
+    解析单段Range请求头
+
+    Args:
+        header: Range请求头的值
+        file_size: 文件大小
+
+    Returns:
+        (start, end): 闭区间字节范围；无法满足时返回None
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or file_size == 0:
+        return None
+    start_text, end_text = match.groups()
+    if start_text == "":
+        # bytes=-N 表示最后N个字节
+        if end_text == "" or int(end_text) == 0:
+            return None
+        start = max(0, file_size - int(end_text))
+        end = file_size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else file_size - 1
+        end = min(end, file_size - 1)
+    if start > end or start >= file_size:
+        return None
+    return start, end
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    """
+    cache目录的HTTP服务
+
+    路由:
+        GET /status.json                当前完整状态
+        GET /status/events?since=N      版本N之后的所有状态事件
+        GET/HEAD /voice/*, /html/*      静态资源，支持Range、强ETag和sendfile零拷贝传输
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        url = urlsplit(self.path)
+        path = self.asset_path(url.path)
+        if path:
+            self.send_asset(path, head_only=True)
+        else:
+            self.send_json({"error": "Not Found"}, status=404, head_only=True)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = self.asset_path(url.path)
+        if path:
+            self.send_asset(path)
+            return
+        if url.path == "/status.json":
+            self.send_json(status_store.snapshot())
+        elif url.path == "/status/events":
+            query = parse_qs(url.query)
+            try:
+                since = int(query.get("since", ["0"])[0])
+            except ValueError:
+                self.send_json({"error": "since must be an integer"}, status=400)
+                return
+            self.send_json(status_store.events_since(since))
+        else:
+            self.send_json({"error": "Not Found"}, status=404)
+
+    def asset_path(self, url_path: str):
+        """
+        将URL路径映射到cache目录下的静态资源文件
+
+        Args:
+            url_path: 请求路径
+
+        Returns:
+            str: 文件路径；不是合法的静态资源时返回None
+        """
+        parts = unquote(url_path).strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in ASSET_DIRS:
+            return None
+        name = parts[1]
+        if not name or name.startswith(".") or "\\" in name:
+            return None
+        path = os.path.join(CACHE_DIR, parts[0], name)
+        return path if os.path.isfile(path) else None
+
+    def send_asset(self, path: str, head_only: bool = False):
+        """
+        发送静态资源
+
+        Args:
+            path: 文件路径
+            head_only: 是否只发送响应头（HEAD请求）
+        """
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_json({"error": "Not Found"}, status=404, head_only=head_only)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = etag_cache.get(path, st)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            cache_control = IMMUTABLE_CACHE_CONTROL if CONTENT_ADDRESSED_RE.match(stem) else REVALIDATE_CACHE_CONTROL
+
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", cache_control)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start, end = 0, st.st_size - 1
+            status = 200
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            # If-Range不匹配时忽略Range，返回完整内容
+            if range_header and (if_range is None or if_range.strip() == etag):
+                byte_range = parse_range(range_header, st.st_size)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{st.st_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start, end = byte_range
+                status = 206
+            length = max(0, end - start + 1)
+
+            self.send_response(status)
+            self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(st.st_mtime, usegmt=True))
+            self.send_header("Cache-Control", cache_control)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+            self.end_headers()
+            if head_only or length == 0:
+                return
+            # socket.sendfile 在支持的平台上使用 os.sendfile 零拷贝，否则自动回退为普通读写
+            self.wfile.flush()
+            self.connection.sendfile(f, offset=start, count=length)
+
+    def send_json(self, data: dict, status: int = 200, head_only: bool = False):
+        """
+        发送JSON响应
+
+        Args:
+            data: 响应数据
+            status: HTTP状态码
+            head_only: 是否只发送响应头（HEAD请求不能带响应体）
+        """
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        # 状态每秒都可能变化，不允许中间层缓存
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 客户端每秒轮询，默认的访问日志过于嘈杂
+        pass
+
+
+def serve(port: int):
+    """
+    启动cache目录HTTP服务
+
+    Args:
+        port: 监听端口
+    """
+    server = ThreadingHTTPServer(("0.0.0.0", port), CacheRequestHandler)
+    server.daemon_threads = True
+    print(f"cache服务已启动: http://0.0.0.0:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    # 从环境变量读取配置
+    # 与 tunnel.sh 转发的端口一致，客户端通过隧道访问 /status.json 和语音文件
+    SERVER_PORT = int(os.environ.get("SERVER_PORT", 8080))
+    try:
+        serve(SERVER_PORT)
+    except KeyboardInterrupt:
+        print("cache服务被中断")
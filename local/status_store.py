@@ -0,0 +1,206 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+# status事件环的默认容量（内存与磁盘保持一致）
+DEFAULT_HISTORY_SIZE = int(os.environ.get("STATUS_HISTORY_SIZE", 256))
+
+
+class StatusStore:
+    """
+    status.json 的版本化存储
+
+    每次更新都会生成一个单调递增的版本号，并记录一条事件到有界的环形历史中
+    （内存 deque + 磁盘 status_events.jsonl）。brain.py、detector.py 等多个进程
+    通过文件锁串行写入，客户端可以用 events_since(version) 一次性补齐错过的中间状态。
+    """
+
+    def __init__(self, cache_dir: str = "./cache", history_size: int = DEFAULT_HISTORY_SIZE):
+        """
+        初始化存储
+
+        Args:
+            cache_dir: 缓存目录，status.json 所在目录
+            history_size: 保留的历史事件数量上限
+        """
+        self.cache_dir = cache_dir
+        self.history_size = max(1, history_size)
+        self.status_path = os.path.join(cache_dir, "status.json")
+        self.events_path = os.path.join(cache_dir, "status_events.jsonl")
+        self.lock_path = os.path.join(cache_dir, "status.lock")
+        self._events = deque(maxlen=self.history_size)
+        # 记录上次加载磁盘事件时文件的 (mtime_ns, size)，用于判断是否需要重新加载
+        self._events_stamp = None
+        # 磁盘文件当前行数（可能大于内存中保留的事件数）
+        self._line_count = 0
+        self._mutex = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的排他文件锁"""
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_status(self) -> dict:
+        if not os.path.exists(self.status_path):
+            return {}
+        try:
+            with open(self.status_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取status.json失败: {e}")
+            return {}
+
+    def _write_json_atomic(self, path: str, data: dict):
+        """先写临时文件再原子替换，避免读者看到写了一半的文件"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+
+    def _load_events(self):
+        """必要时从磁盘重新加载事件环（其他进程可能已追加新事件）"""
+        try:
+            st = os.stat(self.events_path)
+        except FileNotFoundError:
+            self._events.clear()
+            self._events_stamp = None
+            self._line_count = 0
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._events_stamp:
+            return
+        events = deque(maxlen=self.history_size)
+        line_count = 0
+        with open(self.events_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                line_count += 1
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 跳过异常中断时留下的半行
+                    continue
+        self._events = events
+        self._events_stamp = stamp
+        self._line_count = line_count
+
+    def _append_event(self, event: dict):
+        """追加事件到磁盘；文件行数超过容量两倍时压缩为最近的 history_size 条"""
+        self._events.append(event)
+        if self._line_count + 1 > self.history_size * 2:
+            tmp_path = f"{self.events_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for item in self._events:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.events_path)
+            self._line_count = len(self._events)
+        else:
+            with open(self.events_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._line_count += 1
+        st = os.stat(self.events_path)
+        self._events_stamp = (st.st_mtime_ns, st.st_size)
+
+    def update(self, fields: dict, expect: Optional[dict] = None) -> Optional[int]:
+        """
+        合并字段到 status.json 并记录一条新版本事件
+
+        fields 中的 timestamp 保证严格大于当前值：客户端只接受 timestamp > lastTimestamp 的状态，
+        同一秒内的两次更新（例如二维码发布后立即补充摘要）否则会被客户端丢弃
+
+        Args:
+            fields: 需要更新的字段
+            expect: 可选的前置条件，当前状态中这些字段的值都相等时才更新
+
+        Returns:
+            int: 本次更新的版本号；前置条件不满足时返回None
+        """
+        with self._mutex, self._file_lock():
+            self._load_events()
+            data = self._read_status()
+            if expect and any(data.get(k) != v for k, v in expect.items()):
+                return None
+            if "timestamp" in fields:
+                fields = dict(fields)
+                fields["timestamp"] = max(int(fields["timestamp"]), int(data.get("timestamp", 0)) + 1)
+            last_version = self._events[-1]["version"] if self._events else 0
+            version = max(last_version, int(data.get("version", 0))) + 1
+            data.update(fields)
+            data["version"] = version
+            self._write_json_atomic(self.status_path, data)
+            self._append_event({
+                "version": version,
+                "time": time.time(),
+                "fields": fields,
+            })
+            return version
+
+    def snapshot(self) -> dict:
+        """
+        获取当前完整状态
+
+        Returns:
+            dict: status.json 的内容
+        """
+        with self._mutex:
+            return self._read_status()
+
+    def events_since(self, version: int) -> dict:
+        """
+        获取指定版本之后的所有事件
+
+        Args:
+            version: 客户端已知的最新版本号
+
+        Returns:
+            dict: {"version": 当前最新版本, "events": 事件列表, "reset": 是否需要重新拉取完整状态}
+                  当 version 早于环中最旧的事件时 reset 为 True，并附带 snapshot
+        """
+        with self._mutex, self._file_lock():
+            self._load_events()
+            events = list(self._events)
+            snapshot = self._read_status()
+        latest = events[-1]["version"] if events else int(snapshot.get("version", 0))
+        oldest = events[0]["version"] if events else latest + 1
+        result = {
+            "version": latest,
+            "events": [e for e in events if e["version"] > version],
+            "reset": False,
+        }
+        # 中间有事件已被环淘汰，单靠增量无法还原，要求客户端用快照重建
+        if version < oldest - 1 or version > latest:
+            result["reset"] = True
+            result["snapshot"] = snapshot
+        return result
+
+
+# 全局实例
+_store_instance = None
+
+def get_status_store(cache_dir: str = "./cache"):
+    """
+    获取全局status存储实例
+
+    Args:
+        cache_dir: 缓存目录
+
+    Returns:
+        StatusStore: 存储实例
+    """
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = StatusStore(cache_dir)
+    return _store_instance
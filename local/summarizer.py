@@ -0,0 +1,249 @@
+import os
+import re
+import threading
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# 抓取网页时最多读取的字节数，超出部分直接丢弃
+QR_FETCH_MAX_BYTES = int(os.environ.get("QR_FETCH_MAX_BYTES", 512 * 1024))
+QR_FETCH_TIMEOUT = float(os.environ.get("QR_FETCH_TIMEOUT", 5))
+# 发送给模型的正文token预算
+QR_SUMMARY_TOKEN_BUDGET = int(os.environ.get("QR_SUMMARY_TOKEN_BUDGET", 1500))
+QR_SUMMARY_MODEL = os.environ.get("QR_SUMMARY_MODEL", "gpt-4o-mini")
+QR_SUMMARY_MAX_TOKENS = int(os.environ.get("QR_SUMMARY_MAX_TOKENS", 120))
+
+SUMMARY_SYSTEM_PROMPT = "你是一个网页摘要助手，请用中文50字以内总结用户提供的网页内容。你不可以使用专业的计算机网络术语，以对待用户方式回答。如果没有有意义的内容，你可以回复 无摘要 "
+
+# 不可见内容所在的标签
+INVISIBLE_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "object", "head"}
+CJK_RE = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+WHITESPACE_RE = re.compile(r"\s+")
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+
+class VisibleTextExtractor(HTMLParser):
+    """提取网页中用户可见的文字（保留<title>）"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._hidden_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag in INVISIBLE_TAGS:
+            self._hidden_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in INVISIBLE_TAGS and self._hidden_depth > 0:
+            self._hidden_depth -= 1
+
+    def handle_data(self, data):
+        if self._hidden_depth == 0 or self._in_title:
+            text = data.strip()
+            if text:
+                self.parts.append(text)
+
+    def text(self) -> str:
+        return WHITESPACE_RE.sub(" ", " ".join(self.parts)).strip()
+
+
+def fetch_page(url: str, max_bytes: int = QR_FETCH_MAX_BYTES, timeout: float = QR_FETCH_TIMEOUT) -> str:
+    """
+    流式下载网页，最多读取 max_bytes 字节
+
+    Args:
+        url: 网页链接
+        max_bytes: 读取上限
+        timeout: 超时时间（秒）
+
+    Returns:
+        str: 网页内容（按声明的编码解码，默认utf-8）
+    """
+    import requests
+
+    with requests.get(url, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        content_type = resp.headers.get("Content-Type", "text/html")
+        if not content_type.startswith(("text/", "application/xhtml")):
+            return ""
+        chunks = []
+        received = 0
+        for chunk in resp.iter_content(chunk_size=16 * 1024):
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= max_bytes:
+                break
+        raw = b"".join(chunks)[:max_bytes]
+        # 响应头没有声明编码时 requests 会默认 ISO-8859-1，中文网页需要从<meta>里找
+        encoding = resp.encoding if "charset" in content_type.lower() else None
+        if encoding is None:
+            match = META_CHARSET_RE.search(raw[:4096])
+            encoding = match.group(1).decode("ascii") if match else "utf-8"
+        try:
+            return raw.decode(encoding, errors="replace")
+        except LookupError:
+            return raw.decode("utf-8", errors="replace")
+
+
+def extract_visible_text(html: str) -> str:
+    """
+    提取网页的可见文字
+
+    Args:
+        html: 网页内容
+
+    Returns:
+        str: 可见文字
+    """
+    extractor = VisibleTextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception as e:
+        print(f"解析网页失败: {e}")
+    return extractor.text()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算token数：中日韩字符约1个token，其余约4个字符1个token
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    cjk = len(CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_budget(text: str, budget: int = QR_SUMMARY_TOKEN_BUDGET) -> str:
+    """
+    按token预算截断文本
+
+    Args:
+        text: 文本
+        budget: token预算
+
+    Returns:
+        str: 截断后的文本
+    """
+    if estimate_tokens(text) <= budget:
+        return text
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def summarize_url(url: str) -> Optional[str]:
+    """
+    抓取网页并生成摘要
+
+    Args:
+        url: 网页链接
+
+    Returns:
+        str: 摘要；失败时返回None
+    """
+    from openai import OpenAI
+
+    try:
+        print(f"获取网页内容: {url}")
+        text = truncate_to_budget(extract_visible_text(fetch_page(url)))
+        if not text:
+            print(f"网页没有可见文字: {url}")
+            return None
+        prompt = [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"请总结以下网页内容：\n{text}"}
+        ]
+        client = OpenAI(timeout=15.0)
+        completion = client.chat.completions.create(
+            model=QR_SUMMARY_MODEL,
+            messages=prompt,
+            max_tokens=QR_SUMMARY_MAX_TOKENS,
+        )
+        summary = completion.choices[0].message.content.strip()
+        return summary or None
+    except Exception as e:
+        print(f"获取网页内容或GPT总结失败: {e}")
+        return None
+
+
+class SummaryPipeline:
+    """
+    网页摘要流水线
+
+    在独立的线程池中执行 抓取 -> 提取正文 -> 截断 -> 模型总结，完成后回调，
+    调用方可以先发布链接，再在摘要就绪时补充
+    """
+
+    def __init__(self, max_workers: int = 2):
+        """
+        初始化流水线
+
+        Args:
+            max_workers: 同时进行的摘要任务数
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qr-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, url: str, on_done: Callable[[str, str], None],
+               on_failed: Optional[Callable[[str], None]] = None):
+        """
+        提交摘要任务；同一链接已在处理中时忽略
+
+        Args:
+            url: 网页链接
+            on_done: 摘要成功时的回调 on_done(url, summary)
+            on_failed: 抓取失败、没有正文或模型调用失败时的回调 on_failed(url)
+        """
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+
+        def run():
+            try:
+                summary = summarize_url(url)
+                if summary:
+                    on_done(url, summary)
+                elif on_failed is not None:
+                    on_failed(url)
+            except Exception as e:
+                print(f"摘要回调出错: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+
+        self.executor.submit(run)
+
+
+# 全局实例
+_pipeline_instance = None
+
+def get_summary_pipeline():
+    """
+    获取全局摘要流水线实例
+
+    Returns:
+        SummaryPipeline: 流水线实例
+    """
+    global _pipeline_instance
+    if _pipeline_instance is None:
+        _pipeline_instance = SummaryPipeline()
+    return _pipeline_instance
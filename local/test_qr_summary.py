@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from detector import QR_SUMMARY_PLACEHOLDER, clear_qr_summary_placeholder, update_status_json
+from status_store import get_status_store
+
+# 本机不监听的端口：连接立即被拒绝，模拟网页抓取失败
+UNREACHABLE_URL = "https://127.0.0.1:9/qr-summary-test"
+
+
+def setup_module(module=None):
+    # detector.py 使用相对路径 ./cache，在临时目录中运行，不影响真实的 status.json
+    os.chdir(tempfile.mkdtemp())
+
+
+def wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_failed_summary_clears_placeholder():
+    """摘要生成失败后，status.json 中不能一直留着占位弹幕"""
+    store = get_status_store(os.path.join(".", "cache"))
+    update_status_json(UNREACHABLE_URL)
+    status = store.snapshot()
+    assert status["action"] == "qr" and status["value"] == UNREACHABLE_URL
+    assert status["danmu_text"] == QR_SUMMARY_PLACEHOLDER
+
+    assert wait_for(lambda: store.snapshot().get("danmu_text") != QR_SUMMARY_PLACEHOLDER), "占位弹幕没有被清除"
+    status = store.snapshot()
+    assert status["danmu_text"] == ""
+    assert status["action"] == "qr" and status["value"] == UNREACHABLE_URL
+
+
+def test_clear_placeholder_keeps_newer_event():
+    """清除占位弹幕不能覆盖之后的新事件"""
+    store = get_status_store(os.path.join(".", "cache"))
+    store.update({"action": "qr", "value": UNREACHABLE_URL, "danmu_text": QR_SUMMARY_PLACEHOLDER})
+    store.update({"action": "render", "value": "", "danmu_text": "新的弹幕"})
+    clear_qr_summary_placeholder(UNREACHABLE_URL)
+    status = store.snapshot()
+    assert status["action"] == "render" and status["danmu_text"] == "新的弹幕"
+
+
+def main():
+    print("🧪 测试二维码摘要失败时的状态")
+    print("=" * 50)
+    setup_module()
+    failed = 0
+    for test in (test_failed_summary_clears_placeholder, test_clear_placeholder_keeps_newer_event):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()